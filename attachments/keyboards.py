@@ -4,9 +4,11 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from filters.callback_data import (
     CurrentCaseCallBack,
     FileCallback,
+    ManageSendingCaseCallback,
     NewCaseFinishWithFilesCallback,
     NewCaseInterfaceCallback,
 )
+from utils.timezones import format_local
 
 
 main_kb = ReplyKeyboardMarkup(
@@ -55,6 +57,12 @@ async def get_repeat_keyboard():
     builder.button(text='Ежедневно', callback_data='repeat:Ежедневно')
     builder.button(text='Еженедельно', callback_data='repeat:Еженедельно')
     builder.button(text='Ежемесячно', callback_data='repeat:Ежемесячно')
+    builder.button(text='По будням', callback_data='repeat:По будням')
+    builder.button(
+        text='В последний день месяца',
+        callback_data='repeat:В последний день месяца',
+    )
+    builder.button(text='Каждые N дней', callback_data='repeat:Каждые N дней')
     builder.button(text='Без напоминаний', callback_data='repeat:Без напоминаний')
     return builder.adjust(1).as_markup()
 
@@ -66,18 +74,40 @@ async def set_new_case_with_files():
     return builder.adjust(1).as_markup()
 
 
-def create_cases_keyboard(cases):
+def create_cases_keyboard(cases, tz=None):
     builder = InlineKeyboardBuilder()
     for case_row in cases:
         case = case_row[0]
         case_id = case.id
-        button_text = f'{case.name} {case.deadline_date}'
+        button_text = f'{case.name} {format_local(case.deadline_date, tz)}'
         callback_data = CurrentCaseCallBack(case_id=case_id)
         builder.button(text=button_text, callback_data=callback_data)
     builder.adjust(1)
     return builder.as_markup()
 
 
+def create_cases_page_keyboard(cases, prev_callback=None, next_callback=None, tz=None):
+    builder = InlineKeyboardBuilder()
+    for case_row in cases:
+        case = case_row[0]
+        button_text = f'{case.name} {format_local(case.deadline_date, tz)}'
+        builder.button(text=button_text, callback_data=CurrentCaseCallBack(case_id=case.id))
+    nav_buttons = [
+        ('⬅️ Назад', prev_callback),
+        ('Вперёд ➡️', next_callback),
+    ]
+    nav_count = 0
+    for (title, callback_data) in nav_buttons:
+        if callback_data is not None:
+            builder.button(text=title, callback_data=callback_data)
+            nav_count += 1
+    sizes = [1] * len(cases)
+    if nav_count:
+        sizes.append(nav_count)
+    builder.adjust(*sizes)
+    return builder.as_markup()
+
+
 def create_files_keyboard(files):
     builder = InlineKeyboardBuilder()
     for file_row in files:
@@ -129,3 +159,31 @@ def create_sending_case_management_keyboard(case_id):
     builder.button(text='Файлы', callback_data=f'manage_sending_case:files:{case_id}')
     builder.adjust(2)
     return builder.as_markup()
+
+
+def create_digest_keyboard(case_ids):
+    """Клавиатура сводки: кнопки управления каждым делом с его номером в сводке."""
+    builder = InlineKeyboardBuilder()
+    for number, case_id in enumerate(case_ids, start=1):
+        for row in create_sending_case_management_keyboard(case_id).inline_keyboard:
+            builder.row(*(
+                button.model_copy(update={'text': f'{number}. {button.text}'})
+                for button in row
+            ))
+    return builder.as_markup()
+
+
+def remove_case_buttons(markup, case_id):
+    """Клавиатура напоминания без кнопок дела case_id (None, если кнопок не осталось)."""
+    if markup is None:
+        return None
+    rows = [
+        row for row in markup.inline_keyboard
+        if not any(
+            ManageSendingCaseCallback.unpack(button.callback_data).case_id == case_id
+            for button in row
+        )
+    ]
+    if not rows:
+        return None
+    return markup.model_copy(update={'inline_keyboard': rows})
@@ -0,0 +1,87 @@
+"""Бенчмарк отправки напоминаний через DeliveryPool против последовательной отправки.
+
+Запуск: python -m benchmarks.delivery_benchmark --messages 600 --chats 300
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from delivery import DeliveryPool
+
+FAKE_TOKEN = '123456:fake-token'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def send_sequentially(bot, messages):
+    for chat_id, text in messages:
+        await bot.send_message(chat_id=chat_id, text=text)
+
+
+async def send_with_pool(bot, messages, workers):
+    pool = DeliveryPool(workers=workers)
+    pool.start(bot)
+    for chat_id, text in messages:
+        await pool.send_message(chat_id=chat_id, text=text)
+    await pool.stop()
+
+
+async def run(mode, messages_count, chats, workers, latency, port):
+    api = FakeBotAPI(latency=latency)
+    base_url = await api.start(port=port)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    messages = [
+        (index % chats + 1, f'reminder {index}')
+        for index in range(messages_count)
+    ]
+
+    started = time.monotonic()
+    try:
+        if mode == 'sequential':
+            await send_sequentially(bot, messages)
+        else:
+            await send_with_pool(bot, messages, workers)
+    finally:
+        elapsed = time.monotonic() - started
+        await session.close()
+        await api.stop()
+
+    lateness = [received - started for received in api.received_at]
+    print(f'mode={mode} messages={messages_count} chats={chats} workers={workers}')
+    print(f'  total: {elapsed:.2f}s, throughput: {len(lateness) / elapsed:.1f} msg/s')
+    print(f'  lateness p50: {percentile(lateness, 0.5):.2f}s, p99: {percentile(lateness, 0.99):.2f}s')
+    print(f'  flood errors: {api.flood_errors}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=('pool', 'sequential'), default='pool')
+    parser.add_argument('--messages', type=int, default=600)
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    asyncio.run(run(
+        args.mode,
+        args.messages,
+        args.chats,
+        args.workers,
+        args.latency,
+        args.port,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Сравнение способов найти сработавшие дела на тике планировщика.
+
+- scan: прежний проход по всем незавершённым делам на Python со сравнением
+  часа, минуты, дня месяца и дня недели (should_process_repeating_case до
+  перехода на next_fire_at);
+- numpy: та же проверка одной векторной маской по столбцам снимка дел
+  (секунды дедлайна, код повторения, день недели, день месяца) с точечным
+  обновлением строк при записи; нужен numpy (pip install numpy);
+- wheel: колесо таймеров планировщика (utils/timing_wheel.py), для
+  сравнения с минутным тиком - 60 посекундных срабатываний в начале часа,
+  вместе с раскладкой часового слота.
+
+Для scan и numpy проверяется совпадение найденных дел. Время тика scan и
+numpy растёт с числом дел, у колеса - только с числом сработавших.
+
+Запуск: python -m benchmarks.due_detection_benchmark --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from utils.recurrence import REPEAT_DAILY, REPEAT_MONTHLY, REPEAT_WEEKLY
+from utils.timezones import to_epoch_second
+from utils.timing_wheel import SECONDS_PER_DAY, SECONDS_PER_MINUTE, TimingWheel
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+THRESHOLD_SECONDS = 30
+START = datetime(2027, 1, 4, 9, 0)
+HORIZON_MINUTES = 7 * 24 * 60
+REPEATS = (None, REPEAT_DAILY, REPEAT_WEEKLY, REPEAT_MONTHLY)
+REPEAT_WEIGHTS = (5, 2, 2, 1)
+# 1970-01-01 - четверг
+EPOCH_WEEKDAY = 3
+
+
+def generate_cases(count, rng):
+    """Дела (id, дедлайн, повтор) с дедлайнами в пределах недели от START."""
+    minutes = rng.choices(range(HORIZON_MINUTES), k=count)
+    repeats = rng.choices(REPEATS, weights=REPEAT_WEIGHTS, k=count)
+    return [
+        (case_id, START + timedelta(minutes=minute), repeat)
+        for case_id, (minute, repeat) in enumerate(zip(minutes, repeats))
+    ]
+
+
+def scan_due(cases, now):
+    due = []
+    for case_id, deadline, repeat in cases:
+        if repeat:
+            if deadline.hour != now.hour or deadline.minute != now.minute:
+                continue
+            if repeat == REPEAT_MONTHLY and deadline.day != now.day:
+                continue
+            if repeat == REPEAT_WEEKLY and deadline.weekday() != now.weekday():
+                continue
+            due.append(case_id)
+        elif abs((now - deadline).total_seconds()) <= THRESHOLD_SECONDS:
+            due.append(case_id)
+    return due
+
+
+class ColumnarSnapshot:
+    """Столбцы дел для векторной проверки; строка дела - его индекс."""
+
+    def __init__(self, cases):
+        count = len(cases)
+        self.deadline = np.fromiter((to_epoch_second(case[1]) for case in cases), np.int64, count)
+        self.repeat = np.fromiter((REPEATS.index(case[2]) for case in cases), np.int8, count)
+        self.day = np.fromiter((case[1].day for case in cases), np.int8, count)
+        self.minute_of_day = ((self.deadline % SECONDS_PER_DAY) // SECONDS_PER_MINUTE).astype(np.int16)
+        self.weekday = ((self.deadline // SECONDS_PER_DAY + EPOCH_WEEKDAY) % 7).astype(np.int8)
+
+    def patch(self, index, deadline, repeat):
+        """Обновляет строку дела после записи в базу."""
+        second = to_epoch_second(deadline)
+        self.deadline[index] = second
+        self.repeat[index] = REPEATS.index(repeat)
+        self.day[index] = deadline.day
+        self.minute_of_day[index] = second % SECONDS_PER_DAY // SECONDS_PER_MINUTE
+        self.weekday[index] = (second // SECONDS_PER_DAY + EPOCH_WEEKDAY) % 7
+
+    def due(self, now):
+        now_second = to_epoch_second(now)
+        repeat = self.repeat
+        repeating = (
+            (self.minute_of_day == now.hour * 60 + now.minute)
+            & ((repeat != REPEATS.index(REPEAT_MONTHLY)) | (self.day == now.day))
+            & ((repeat != REPEATS.index(REPEAT_WEEKLY)) | (self.weekday == now.weekday()))
+        )
+        single = np.abs(self.deadline - now_second) <= THRESHOLD_SECONDS
+        return np.flatnonzero(np.where(repeat == 0, single, repeating))
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def median_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def run_size(count, ticks, rng):
+    cases = generate_cases(count, rng)
+    moments = [START + timedelta(minutes=rng.randrange(HORIZON_MINUTES)) for _ in range(ticks)]
+    result = {'cases': count}
+
+    scan_samples = []
+    scanned = []
+    for now in moments:
+        due, elapsed = timed(scan_due, cases, now)
+        scan_samples.append(elapsed)
+        scanned.append(due)
+    result['scan_ms'] = median_ms(scan_samples)
+    result['due'] = statistics.median(len(due) for due in scanned)
+
+    if np is not None:
+        snapshot, result['numpy_build_s'] = timed(ColumnarSnapshot, cases)
+        numpy_samples = []
+        for now, expected in zip(moments, scanned):
+            due, elapsed = timed(snapshot.due, now)
+            numpy_samples.append(elapsed)
+            assert due.tolist() == expected, 'numpy mask disagrees with the scan'
+        result['numpy_ms'] = median_ms(numpy_samples)
+        writes = rng.sample(range(count), min(count, 10000))
+        _, elapsed = timed(lambda: [snapshot.patch(index, *cases[index][1:]) for index in writes])
+        result['numpy_patch_us'] = elapsed / len(writes) * 1e6
+
+    start_second = to_epoch_second(START)
+    wheel = TimingWheel(start_second)
+    for case_id, deadline, _ in cases:
+        wheel.schedule(case_id, to_epoch_second(deadline))
+    wheel_samples = []
+    for tick in range(1, ticks + 1):
+        # Минута колеса, начиная с часа после START, - 60 посекундных срабатываний
+        first = start_second + tick * 3600
+        wheel.advance(first - 1)
+        _, elapsed = timed(lambda: [wheel.advance(second) for second in range(first, first + 60)])
+        wheel_samples.append(elapsed)
+    result['wheel_ms'] = median_ms(wheel_samples)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--ticks', type=int, default=5, help='ticks measured per size')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if np is None:
+        print('numpy is not installed, the numpy column is skipped')
+
+    rng = random.Random(args.seed)
+    print(f'{"cases":>9} {"due":>6} {"scan ms":>9} {"numpy ms":>9} {"build s":>8} {"patch us":>9} {"wheel ms":>9}')
+    for count in args.sizes:
+        result = run_size(count, args.ticks, rng)
+        numpy_columns = (
+            f'{result["numpy_ms"]:9.2f} {result["numpy_build_s"]:8.2f} {result["numpy_patch_us"]:9.2f}'
+            if 'numpy_ms' in result else f'{"-":>9} {"-":>8} {"-":>9}'
+        )
+        print(
+            f'{result["cases"]:9d} {result["due"]:6.0f} {result["scan_ms"]:9.2f} '
+            f'{numpy_columns} {result["wheel_ms"]:9.2f}',
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Локальная заглушка Telegram Bot API для бенчмарков без сети.
+
+Сервер принимает запросы вида POST /bot<token>/<method>, отвечает с
+заданной задержкой и, как настоящий Telegram, возвращает 429 с
+retry_after при превышении общего или поканального лимита.
+"""
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+DEFAULT_LATENCY_SECONDS = 0.05
+
+
+class FakeBotAPI:
+    def __init__(
+            self,
+            latency=DEFAULT_LATENCY_SECONDS,
+            global_rate=30,
+            per_chat_rate=1,
+    ):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.calls = defaultdict(int)
+        self.received_at = []
+        self.flood_errors = 0
+        self.in_flight = 0
+        self._global_window = deque()
+        self._chat_windows = defaultdict(deque)
+        self._message_id = 0
+        self._runner = None
+
+    def _is_flood(self, chat_id, now):
+        windows = (
+            (self._global_window, self.global_rate),
+            (self._chat_windows[chat_id], self.per_chat_rate),
+        )
+        for window, limit in windows:
+            while window and now - window[0] >= 1:
+                window.popleft()
+            if len(window) >= limit:
+                return True
+        for window, _ in windows:
+            window.append(now)
+        return False
+
+    async def handle(self, request):
+        self.in_flight += 1
+        try:
+            return await self._handle(request)
+        finally:
+            self.in_flight -= 1
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+
+        chat_id = int(params.get('chat_id', 0))
+        if method == 'sendMessage' and self._is_flood(chat_id, time.monotonic()):
+            self.flood_errors += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1},
+            })
+
+        self.received_at.append(time.monotonic())
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+        }
+        if method == 'sendDocument':
+            message['document'] = {
+                'file_id': f'fake-file-{self._message_id}',
+                'file_unique_id': f'fake-unique-{self._message_id}',
+            }
+        else:
+            message['text'] = params.get('text', '')
+        return web.json_response({'ok': True, 'result': message})
+
+    async def start(self, host='127.0.0.1', port=8081):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        await self._runner.cleanup()
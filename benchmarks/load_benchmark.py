@@ -0,0 +1,331 @@
+"""Нагрузочный прогон планировщика и обработчиков на синтетических данных.
+
+Создаёт во временной SQLite-базе N пользователей и M дел (разовые и
+повторяющиеся), выполняет тик планировщика и сценарии обработчиков через
+Dispatcher бота с Bot без сети (benchmarks/recording_session.py) и выводит
+длительность тика, p50/p99 задержки обработчиков, число SQL-запросов и
+вызовов Bot API на обновление. Результаты пишутся в JSON для сравнения
+между коммитами.
+
+Запуск: python -m benchmarks.load_benchmark --users 1000 --cases 20000 --output load.json
+"""
+import argparse
+import asyncio
+import calendar
+import contextlib
+import json
+import locale
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.delivery_benchmark import percentile
+
+FAKE_TOKEN = '123456:fake-token'
+FIRST_USER_ID = 10 ** 6
+# Доля вариантов повторения среди созданных дел (None - разовое дело)
+REPEAT_MIX = (None, None, None, 'Ежедневно', 'Еженедельно', 'Ежемесячно', 'По будням')
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные движками базы (записи и чтения)."""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in set(engines):
+            event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def seed(engine, users_count, cases_count, due_fraction, finished_fraction, rng):
+    """Заполняет базу пользователями и делами напрямую, минуя обработчики."""
+    from database.models import Cases, Users
+    from utils.partitions import get_partition
+    from utils.recurrence import rule_for_repeat
+    from utils.schedule import compute_next_fire_at
+    from utils.timezones import DEFAULT_TZ, utcnow
+
+    now = utcnow()
+    users = [
+        {'id': str(FIRST_USER_ID + index), 'first_name': 'bench', 'tz': DEFAULT_TZ}
+        for index in range(users_count)
+    ]
+    cases = []
+    for index in range(cases_count):
+        user_id = users[index % users_count]['id']
+        repeat = rng.choice(REPEAT_MIX)
+        rule = rule_for_repeat(repeat)
+        if rng.random() < due_fraction:
+            # Срабатывает в окне ближайшего тика
+            deadline = now + timedelta(seconds=rng.uniform(-20, 20))
+        else:
+            deadline = now + timedelta(days=rng.uniform(-30, 30))
+        is_finished = rng.random() < finished_fraction
+        next_fire_at = None
+        if not is_finished:
+            next_fire_at = compute_next_fire_at(deadline, rule, now - timedelta(seconds=30))
+        cases.append({
+            'user_id': user_id,
+            'name': f'case {index}',
+            'description': 'benchmark',
+            'start_date': now,
+            'deadline_date': deadline,
+            'original_deadline': deadline,
+            'last_notification': now,
+            'repeat': repeat,
+            'rrule': rule,
+            'is_finished': is_finished,
+            'next_fire_at': next_fire_at,
+            'partition': get_partition(user_id),
+        })
+    with engine.begin() as connection:
+        connection.execute(Users.__table__.insert(), users)
+        connection.execute(Cases.__table__.insert(), cases)
+
+
+def make_user(user_id):
+    from aiogram.types import User
+
+    return User(id=user_id, is_bot=False, first_name='bench')
+
+
+def make_message(update_id, user_id, text):
+    from aiogram.types import Chat, Message, Update
+
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=user_id, type='private'),
+            from_user=make_user(user_id),
+            text=text,
+        ),
+    )
+
+
+def make_callback(update_id, user_id, data):
+    from aiogram.types import CallbackQuery, Chat, Message, Update
+
+    return Update(
+        update_id=update_id,
+        callback_query=CallbackQuery(
+            id=str(update_id),
+            from_user=make_user(user_id),
+            chat_instance='bench',
+            data=data,
+            message=Message(
+                message_id=update_id,
+                date=datetime.now(),
+                chat=Chat(id=user_id, type='private'),
+                text='',
+            ),
+        ),
+    )
+
+
+def find_button(markup, text):
+    """callback_data кнопки с текстом text из последней клавиатуры чата."""
+    if markup is None:
+        return None
+    for row in markup.inline_keyboard:
+        for button in row:
+            if button.text == text:
+                return button.callback_data
+    return None
+
+
+class Driver:
+    """Передаёт обновления в Dispatcher и собирает метрики по сценариям."""
+
+    def __init__(self, dispatcher, bot, session, queries):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.session = session
+        self.queries = queries
+        self.samples = defaultdict(list)
+        self._update_ids = iter(range(1, 10 ** 9))
+
+    async def message(self, scenario, user_id, text):
+        await self._feed(scenario, make_message(next(self._update_ids), user_id, text))
+
+    async def callback(self, scenario, user_id, data):
+        await self._feed(scenario, make_callback(next(self._update_ids), user_id, data))
+
+    async def _feed(self, scenario, update):
+        queries_before = self.queries.count
+        calls_before = self.session.total_calls
+        started = time.perf_counter()
+        await self.dispatcher.feed_update(self.bot, update)
+        self.samples[scenario].append((
+            time.perf_counter() - started,
+            self.queries.count - queries_before,
+            self.session.total_calls - calls_before,
+        ))
+
+    def report(self):
+        report = {}
+        for scenario, samples in self.samples.items():
+            latencies = [sample[0] for sample in samples]
+            report[scenario] = {
+                'updates': len(samples),
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'queries_per_update': round(sum(sample[1] for sample in samples) / len(samples), 2),
+                'telegram_calls_per_update': round(
+                    sum(sample[2] for sample in samples) / len(samples), 2,
+                ),
+            }
+        return report
+
+
+async def run_new_case(driver, user_id, day):
+    """Сценарий /new_case: без описания, ежедневный повтор, без файлов."""
+    from aiogram_calendar import SimpleCalendarCallback
+    from aiogram_calendar.schemas import SimpleCalAct
+
+    from filters.callback_data import NewCaseInterfaceCallback
+
+    no_option = NewCaseInterfaceCallback(
+        case_description_option=False,
+        case_files_option=False,
+    ).pack()
+    await driver.message('new_case', user_id, '/new_case')
+    await driver.message('new_case', user_id, 'Benchmark case')
+    await driver.callback('new_case', user_id, no_option)
+    await driver.callback('new_case', user_id, SimpleCalendarCallback(
+        act=SimpleCalAct.day,
+        year=day.year,
+        month=day.month,
+        day=day.day,
+    ).pack())
+    await driver.message('new_case', user_id, '09:30')
+    await driver.callback('new_case', user_id, 'repeat:Ежедневно')
+    await driver.callback('new_case', user_id, no_option)
+
+
+async def run_tick(bot, session, queries):
+    from leases import lease_manager
+    from scheduler import reminder_queue, scheduler_tick
+
+    # Аренда партиций берётся заранее: в замер попадает только сам тик
+    reminder_queue.set_partitions(await lease_manager.sync())
+    queries_before = queries.count
+    calls_before = session.total_calls
+    started = time.perf_counter()
+    await scheduler_tick(bot)
+    return {
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        'queries': queries.count - queries_before,
+        'telegram_calls': session.total_calls - calls_before,
+    }
+
+
+async def run(args):
+    from aiogram import Bot
+
+    from benchmarks.recording_session import RecordingSession
+    from bot import dp
+    from database.db import db
+    from database.migrations import upgrade
+
+    # database.db включает подробный лог при импорте
+    logging.getLogger().setLevel(logging.WARNING)
+    upgrade(db.engine)
+    rng = random.Random(args.seed)
+    seed(db.engine, args.users, args.cases, args.due_fraction, args.finished_fraction, rng)
+
+    session = RecordingSession()
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    queries = QueryCounter(db.engine, db.read_engine)
+    tick = await run_tick(bot, session, queries)
+
+    driver = Driver(dp, bot, session, queries)
+    sampled_users = rng.sample(range(args.users), min(args.sample_users, args.users))
+    new_case_day = datetime.now().date() + timedelta(days=1)
+    for index in sampled_users:
+        user_id = FIRST_USER_ID + index
+        await driver.message('active_cases', user_id, '/active_cases')
+        next_page = find_button(session.last_markup.get(user_id), 'Вперёд ➡️')
+        if next_page:
+            await driver.callback('active_cases_next_page', user_id, next_page)
+        await driver.message('today_cases', user_id, '/today_cases')
+        await run_new_case(driver, user_id, new_case_day)
+        await driver.message('stop', user_id, '/stop')
+
+    return {
+        'meta': {
+            'commit': git_revision(),
+            'users': args.users,
+            'cases': args.cases,
+            'sampled_users': len(sampled_users),
+            'due_fraction': args.due_fraction,
+            'seed': args.seed,
+        },
+        'tick': tick,
+        'handlers': driver.report(),
+        'telegram_methods': dict(session.calls),
+    }
+
+
+def ensure_calendar_locale():
+    """Разрешает запуск без локали ru_RU, которая есть только в образе бота.
+
+    SimpleCalendar переключает локаль через calendar.different_locale; если
+    её нет в системе, календарь рисуется с названиями месяцев текущей локали.
+    """
+    try:
+        with calendar.different_locale('ru_RU.utf8'):
+            return
+    except locale.Error:
+        logging.warning('ru_RU.utf8 locale is missing, calendars use the current locale')
+    calendar.different_locale = lambda _locale: contextlib.nullcontext()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--sample-users', type=int, default=200, help='users driven through handlers')
+    parser.add_argument('--due-fraction', type=float, default=0.01, help='cases due in the measured tick')
+    parser.add_argument('--finished-fraction', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='path of the JSON report')
+    args = parser.parse_args()
+
+    # Временная база и фиктивный токен выбираются до импорта модулей бота
+    workdir = tempfile.mkdtemp(prefix='load_benchmark_')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "database.db")}'
+    os.environ['BOT_TOKEN'] = FAKE_TOKEN
+
+    ensure_calendar_locale()
+    results = asyncio.run(run(args))
+    report = json.dumps(results, ensure_ascii=False, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import itertools
+import typing
+from collections import Counter
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, InlineKeyboardMarkup, Message
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot без сети: считает вызовы Bot API и отвечает заглушками.
+
+    Методы, возвращающие Message, получают сообщение с новым message_id,
+    остальные - True. Последняя inline-клавиатура, отправленная в каждый чат,
+    сохраняется, чтобы сценарии могли «нажимать» её кнопки.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self.last_markup = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        chat_id = getattr(method, 'chat_id', None)
+        reply_markup = getattr(method, 'reply_markup', None)
+        # Нажимать можно только inline-кнопки, обычная клавиатура не сохраняется
+        if not isinstance(reply_markup, InlineKeyboardMarkup):
+            reply_markup = None
+        if chat_id is not None and reply_markup is not None:
+            self.last_markup[int(chat_id)] = reply_markup
+
+        returning = method.__returning__
+        if returning is Message or Message in typing.get_args(returning):
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=int(chat_id or 0), type='private'),
+                text=getattr(method, 'text', None),
+                reply_markup=reply_markup,
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError('RecordingSession does not download files')
+        yield b''  # noqa: WPS220 - делает метод асинхронным генератором
+
+    async def close(self):
+        pass
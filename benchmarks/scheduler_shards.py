@@ -0,0 +1,163 @@
+"""Проверка шардированного планировщика несколькими процессами на одной базе.
+
+Создаёт временную SQLite-базу с делами, срабатывающими в ближайшие секунды,
+запускает несколько процессов-воркеров с заглушкой бота, посреди прогона
+убивает один из них и проверяет, что его партиции перешли к остальным,
+а каждое напоминание отправлено ровно один раз.
+
+Запуск: python -m benchmarks.scheduler_shards --workers 3 --cases 300
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+
+class RecordingBot:
+    """Заглушка Bot: дописывает название дела в общий журнал отправок."""
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        case_name = text.splitlines()[1].removeprefix('🔹 ')
+        with open(self.journal_path, 'a') as journal:
+            journal.write(f'{os.getpid()} {case_name}\n')
+
+
+async def run_worker(journal_path, ttl, interval):
+    # Импорты после выбора DATABASE_URL в родительском процессе
+    from leases import lease_manager
+    from scheduler import scheduler_tick
+
+    logging.getLogger().setLevel(logging.WARNING)
+    lease_manager.ttl = timedelta(seconds=ttl)
+    bot = RecordingBot(journal_path)
+    while True:
+        await scheduler_tick(bot)
+        await asyncio.sleep(interval)
+
+
+def seed(cases_count, users_count, spread):
+    from database.db import async_db
+    from database.models import Cases
+    from utils.partitions import get_partition
+    from utils.timezones import utcnow
+
+    now = utcnow()
+    cases = []
+    for index in range(cases_count):
+        user_id = str(10 ** 6 + index % users_count)
+        fire_at = now + timedelta(seconds=random.uniform(2, spread))
+        cases.append(Cases(
+            user_id=user_id,
+            name=f'case-{index}',
+            start_date=now,
+            last_notification=now,
+            description='',
+            deadline_date=fire_at,
+            original_deadline=fire_at,
+            next_fire_at=fire_at,
+            partition=get_partition(user_id),
+        ))
+    asyncio.run(async_db.create_objects(cases))
+
+
+def lease_owners():
+    from sqlalchemy import select
+
+    from database.db import db
+    from database.models import SchedulerLease
+
+    rows = db.sql_query(select(SchedulerLease.owner), is_single=False)
+    return Counter(row[0] for row in rows)
+
+
+def wait_for_balance(workers_count, timeout):
+    """Ждёт, пока все партиции будут разобраны всеми воркерами."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        owners = lease_owners()
+        if None not in owners and len(owners) == workers_count:
+            return owners
+        time.sleep(0.5)
+    raise TimeoutError(f'Partitions were not balanced: {owners}')
+
+
+def spawn_worker(journal_path, ttl, interval):
+    return subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.scheduler_shards', '--worker',
+        '--journal', journal_path,
+        '--ttl', str(ttl),
+        '--interval', str(interval),
+    ])
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='scheduler_shards_')
+    db_path = os.path.join(workdir, 'database.db')
+    journal_path = os.path.join(workdir, 'sent.log')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from database.db import db
+    from database.migrations import upgrade
+    upgrade(db.engine)
+
+    workers = [spawn_worker(journal_path, args.ttl, args.interval) for _ in range(args.workers)]
+    try:
+        owners = wait_for_balance(args.workers, timeout=60)
+        print(f'lease owners before kill: {sorted(owners.values())}')
+        seed(args.cases, args.users, args.spread)
+        time.sleep(args.spread / 3)
+        victim = workers.pop(0)
+        victim.send_signal(signal.SIGKILL)
+        victim.wait()
+        print(f'killed worker {victim.pid}')
+        time.sleep(args.spread - args.spread / 3 + args.ttl + 2 * args.interval + 2)
+        owners = lease_owners()
+        print(f'lease owners after kill: {sorted(owners.values())}')
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+    with open(journal_path) as journal:
+        sent = Counter(line.split()[1] for line in journal)
+    duplicates = {name: count for name, count in sent.items() if count > 1}
+    missed = args.cases - len(sent)
+    print(f'cases: {args.cases}, sent: {len(sent)}, missed: {missed}, duplicates: {len(duplicates)}')
+    orphaned = sum(
+        count for owner, count in owners.items()
+        if owner is None or owner.endswith(f':{victim.pid}')
+    )
+    print(f'orphaned partitions: {orphaned}')
+    print(f'database: {db_path}')
+    return 0 if not missed and not duplicates and not orphaned else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--cases', type=int, default=300)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--spread', type=float, default=15, help='seconds over which cases fire')
+    parser.add_argument('--ttl', type=float, default=3, help='lease ttl in seconds')
+    parser.add_argument('--interval', type=float, default=0.5, help='tick interval in seconds')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--journal', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        asyncio.run(run_worker(args.journal, args.ttl, args.interval))
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Сравнение профилей движка SQLite (SQLITE_PROFILE) на смешанной нагрузке.
+
+Для каждого профиля в отдельном процессе создаётся временная база с
+синтетическими делами (как в load_benchmark), после чего заданное время
+параллельно работают пользователи, которых прогоняют через сценарии
+обработчиков (чтение списков, создание дела с записью состояния диалога),
+тики планировщика в этом же процессе и, по желанию, отдельные процессы
+воркеров планировщика на той же базе. Выводятся обновления и SQL-запросы
+в секунду, p50/p99 обработчиков и тиков.
+
+Запуск: python -m benchmarks.sqlite_profile_benchmark --profiles legacy wal --duration 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.delivery_benchmark import percentile
+from benchmarks.load_benchmark import (
+    FAKE_TOKEN,
+    FIRST_USER_ID,
+    Driver,
+    QueryCounter,
+    ensure_calendar_locale,
+    run_new_case,
+    seed,
+)
+
+
+async def user_loop(driver, user_id, deadline, day):
+    while time.perf_counter() < deadline:
+        await driver.message('active_cases', user_id, '/active_cases')
+        await driver.message('today_cases', user_id, '/today_cases')
+        await run_new_case(driver, user_id, day)
+
+
+async def scheduler_loop(bot, deadline, interval, durations):
+    from scheduler import scheduler_tick
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await scheduler_tick(bot)
+        durations.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def run_tick_process(interval):
+    """Воркер планировщика в отдельном процессе на той же базе."""
+    from aiogram import Bot
+
+    from benchmarks.recording_session import RecordingSession
+    from scheduler import scheduler_tick
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bot = Bot(token=FAKE_TOKEN, session=RecordingSession())
+    while True:
+        await scheduler_tick(bot)
+        await asyncio.sleep(interval)
+
+
+def spawn_tick_process(interval):
+    return subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.sqlite_profile_benchmark', '--tick-process',
+        '--tick-interval', str(interval),
+    ])
+
+
+async def run_profile(args):
+    from aiogram import Bot
+
+    from benchmarks.recording_session import RecordingSession
+    from bot import dp
+    from database.db import db
+    from database.migrations import upgrade
+
+    logging.getLogger().setLevel(logging.WARNING)
+    upgrade(db.engine)
+    seed(
+        db.engine,
+        max(args.users, args.concurrency),
+        args.cases,
+        args.due_fraction,
+        args.finished_fraction,
+        random.Random(args.seed),
+    )
+    session = RecordingSession()
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    queries = QueryCounter(db.engine, db.read_engine)
+    driver = Driver(dp, bot, session, queries)
+    tick_durations = []
+    day = datetime.now().date() + timedelta(days=1)
+
+    tick_processes = [spawn_tick_process(args.tick_interval) for _ in range(args.tick_processes)]
+    try:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(
+            scheduler_loop(bot, deadline, args.tick_interval, tick_durations),
+            *(
+                user_loop(driver, FIRST_USER_ID + index, deadline, day)
+                for index in range(args.concurrency)
+            ),
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        for process in tick_processes:
+            process.terminate()
+            process.wait()
+
+    updates = sum(len(samples) for samples in driver.samples.values())
+    handlers = driver.report()
+    return {
+        'profile': db.profile,
+        'updates': updates,
+        'updates_per_second': round(updates / elapsed, 1),
+        'queries_per_second': round(queries.count / elapsed, 1),
+        'ticks': len(tick_durations),
+        'tick_p50_ms': round(percentile(tick_durations, 0.5) * 1000, 3),
+        'tick_p99_ms': round(percentile(tick_durations, 0.99) * 1000, 3),
+        # При параллельной нагрузке запросы на обновление не разделить
+        'handlers': {
+            scenario: {'p50_ms': report['p50_ms'], 'p99_ms': report['p99_ms']}
+            for scenario, report in handlers.items()
+        },
+    }
+
+
+def run_child(args):
+    """Прогон одного профиля: база и профиль заданы окружением родителя."""
+    ensure_calendar_locale()
+    print(json.dumps(asyncio.run(run_profile(args))))
+
+
+def child_args(args):
+    return [
+        '--duration', str(args.duration),
+        '--concurrency', str(args.concurrency),
+        '--users', str(args.users),
+        '--cases', str(args.cases),
+        '--due-fraction', str(args.due_fraction),
+        '--finished-fraction', str(args.finished_fraction),
+        '--tick-interval', str(args.tick_interval),
+        '--tick-processes', str(args.tick_processes),
+        '--seed', str(args.seed),
+    ]
+
+
+def run(args):
+    results = []
+    for profile in args.profiles:
+        workdir = tempfile.mkdtemp(prefix=f'sqlite_profile_{profile}_')
+        env = dict(
+            os.environ,
+            DATABASE_URL=f'sqlite:///{os.path.join(workdir, "database.db")}',
+            SQLITE_PROFILE=profile,
+            BOT_TOKEN=FAKE_TOKEN,
+        )
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.sqlite_profile_benchmark', '--child', *child_args(args)],
+            env=env,
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f'{profile:>8}: {result["updates_per_second"]:8.1f} updates/s, '
+            f'{result["queries_per_second"]:8.1f} queries/s, '
+            f'ticks p50 {result["tick_p50_ms"]:.1f} ms, p99 {result["tick_p99_ms"]:.1f} ms',
+        )
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--profiles', nargs='+', default=['legacy', 'wal'])
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load per profile')
+    parser.add_argument('--concurrency', type=int, default=20, help='users driven in parallel')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--due-fraction', type=float, default=0.01)
+    parser.add_argument('--finished-fraction', type=float, default=0.3)
+    parser.add_argument('--tick-interval', type=float, default=1, help='seconds between scheduler ticks')
+    parser.add_argument('--tick-processes', type=int, default=1, help='extra scheduler worker processes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='path of the JSON report')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--tick-process', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.tick_process:
+        asyncio.run(run_tick_process(args.tick_interval))
+    elif args.child:
+        run_child(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Нагрузочный прогон webhook-режима синтетическими обновлениями.
+
+Поднимает webhook-приложение бота и заглушку Bot API, отправляет
+обновления /stop от разных пользователей параллельными POST-запросами
+и измеряет, сколько обновлений в секунду обрабатывается до ответа бота.
+
+Запуск: python -m benchmarks.webhook_benchmark --updates 1000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from aiohttp import ClientSession
+
+os.environ.setdefault('BOT_TOKEN', '123456:fake-token')
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI  # noqa: E402
+from bot import dp  # noqa: E402
+from database.db import db  # noqa: E402
+from database.migrations import upgrade  # noqa: E402
+from webhook import WEBHOOK_PATH, create_webhook_app  # noqa: E402
+
+SECRET = 'benchmark-secret'
+
+
+def make_update(update_id):
+    user = {'id': 10 ** 6 + update_id, 'is_bot': False, 'first_name': 'bench'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user['id'], 'type': 'private'},
+            'from': user,
+            'text': '/stop',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    }
+
+
+async def post_updates(url, updates, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+    async with ClientSession() as session:
+        async def post(update):
+            async with semaphore:
+                async with session.post(url, json=update, headers=headers) as response:
+                    response.raise_for_status()
+
+        await asyncio.gather(*(post(update) for update in updates))
+        async with session.post(url, json=updates[0]) as response:
+            assert response.status == 401, 'Webhook accepted a request without secret'
+
+
+async def run(updates_count, concurrency, api_port, webhook_port):
+    upgrade(db.engine)
+    api = FakeBotAPI(latency=0.01, global_rate=10 ** 9)
+    base_url = await api.start(port=api_port)
+    bot = Bot(
+        token=os.environ['BOT_TOKEN'],
+        session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)),
+    )
+    runner = web.AppRunner(create_webhook_app(dp, bot, secret_token=SECRET))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', webhook_port).start()
+
+    updates = [make_update(update_id) for update_id in range(1, updates_count + 1)]
+    started = time.monotonic()
+    try:
+        await post_updates(
+            f'http://127.0.0.1:{webhook_port}{WEBHOOK_PATH}',
+            updates,
+            concurrency,
+        )
+        accepted = time.monotonic() - started
+        # Обработка идёт в фоне - ждём, пока бот ответит на все обновления
+        while api.calls['sendMessage'] < updates_count or api.in_flight:
+            await asyncio.sleep(0.01)
+        handled = time.monotonic() - started
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+        await api.stop()
+
+    print(f'updates={updates_count} concurrency={concurrency}')
+    print(f'  accepted: {accepted:.2f}s ({updates_count / accepted:.0f} updates/s)')
+    print(f'  handled: {handled:.2f}s ({updates_count / handled:.0f} updates/s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--webhook-port', type=int, default=8090)
+    args = parser.parse_args()
+    asyncio.run(run(args.updates, args.concurrency, args.api_port, args.webhook_port))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,45 @@
 import asyncio
 import os
+from datetime import datetime
 
 from aiogram import Bot, Dispatcher
+from aiohttp import web
 from dotenv import load_dotenv
 
-from database.db import db
-from database.models import Base
-from handlers import active_cases, any, finished_cases, new_case, user
-from scheduler import check_and_send_reminders, router, scheduler
-
-# Загрузка переменных окружения
+# Загрузка переменных окружения - до модулей проекта: database.db и
+# handler_stats читают свои настройки при импорте
 load_dotenv()
 
+from database.cache import log_cache_stats  # noqa: E402
+from database.db import db  # noqa: E402
+from database.fsm_storage import SQLiteStorage  # noqa: E402
+from database.migrations import upgrade  # noqa: E402
+from database.query_plans import check_query_plans  # noqa: E402
+from handler_stats import handler_stats  # noqa: E402
+from handlers import active_cases, admin, any, finished_cases, new_case, user  # noqa: E402
+from leases import lease_manager  # noqa: E402
+from metrics import TelegramMetricsMiddleware, metrics_server  # noqa: E402
+from outbox import outbox_relay  # noqa: E402
+from scheduler import (  # noqa: E402
+    CHECK_INTERVAL_SECONDS,
+    reminder_timer,
+    router,
+    scheduler,
+    scheduler_tick,
+)
+from webhook import WEBHOOK_PATH, create_webhook_app  # noqa: E402
+
 # Инициализация бота и диспетчера
 bot = Bot(token=os.getenv('BOT_TOKEN'))
-dp = Dispatcher()
+bot.session.middleware(TelegramMetricsMiddleware())
+fsm_storage = SQLiteStorage()
+dp = Dispatcher(storage=fsm_storage)
+# Замеры обработчиков для /admin_stats (см. handler_stats.py)
+handler_stats.setup(dp, bot)
 
 # Подключение роутеров
 dp.include_routers(
+    admin.router,
     user.router,
     new_case.router,
     active_cases.router,
@@ -27,14 +49,38 @@ dp.include_routers(
 )
 
 
-async def main():
-    # Создаём таблицы в базе данных
-    Base.metadata.create_all(bind=db.engine)
+async def start_background_services():
+    # Создаём таблицы в базе данных и обновляем схему существующей
+    upgrade(db.engine)
+    check_query_plans(db.engine)
+
+    # Запускаем доставку напоминаний из outbox через пул воркеров
+    outbox_relay.start(bot)
 
-    # Добавление задачи для планировщика (напоминания)
-    scheduler.add_job(check_and_send_reminders, 'interval', seconds=60, args=[bot])
+    # Добавление задачи для планировщика (напоминания). При RUN_SCHEDULER=0
+    # напоминания рассылают отдельные процессы scheduler_worker.py.
+    # Первый тик запускается сразу и в фоне: он догоняет напоминания,
+    # пропущенные во время простоя, не задерживая запуск polling.
+    # Сами напоминания в срок до секунды ставит в очередь таймер
+    if os.getenv('RUN_SCHEDULER', '1') == '1':
+        reminder_timer.start()
+        scheduler.add_job(
+            scheduler_tick,
+            'interval',
+            seconds=CHECK_INTERVAL_SECONDS,
+            args=[bot],
+            next_run_time=datetime.now(),
+        )
+    # Очистка брошенных диалогов
+    scheduler.add_job(fsm_storage.evict_expired, 'interval', hours=1)
+    # Очистка доставленных напоминаний
+    scheduler.add_job(outbox_relay.purge, 'interval', hours=1)
+    # Статистика кэшей дел
+    scheduler.add_job(log_cache_stats, 'interval', minutes=10)
     scheduler.start()  # Начинаем работу с планировщиком
 
+
+async def run_polling():
     # Удаляем webhook, чтобы начать получать обновления через long-polling
     await bot.delete_webhook(drop_pending_updates=True)
 
@@ -42,5 +88,59 @@ async def main():
     await dp.start_polling(bot)
 
 
+def get_webhook_url():
+    """Адрес webhook; без WEBHOOK_BASE_URL режим webhook не запускается."""
+    base_url = os.getenv('WEBHOOK_BASE_URL', '').strip().rstrip('/')
+    if not base_url:
+        raise RuntimeError(
+            'BOT_MODE=webhook requires WEBHOOK_BASE_URL, '
+            'the public address Telegram sends updates to (e.g. https://bot.example.com)',
+        )
+    return f'{base_url}{WEBHOOK_PATH}'
+
+
+async def run_webhook(url):
+    # Telegram сам присылает обновления параллельными запросами
+    await bot.set_webhook(
+        url=url,
+        secret_token=os.getenv('WEBHOOK_SECRET'),
+        max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
+        drop_pending_updates=True,
+    )
+    app = create_webhook_app(dp, bot, secret_token=os.getenv('WEBHOOK_SECRET'))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        host=os.getenv('WEBAPP_HOST', '0.0.0.0'),
+        port=int(os.getenv('WEBAPP_PORT', '8080')),
+    )
+    await site.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def main():
+    # Настройки режима проверяются до запуска фоновых задач
+    webhook_url = get_webhook_url() if os.getenv('BOT_MODE', 'polling') == 'webhook' else None
+    await start_background_services()
+    await metrics_server.start(
+        host=os.getenv('METRICS_HOST', '0.0.0.0'),
+        port=os.getenv('METRICS_PORT', '9100'),
+    )
+    try:
+        if webhook_url is not None:
+            await run_webhook(webhook_url)
+        else:
+            await run_polling()
+    finally:
+        await reminder_timer.stop()
+        await outbox_relay.stop()
+        await lease_manager.release_all()
+        await metrics_server.stop()
+
+
 if __name__ == '__main__':
     asyncio.run(main())
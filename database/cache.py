@@ -0,0 +1,48 @@
+import logging
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Статус дела (завершение, следующее срабатывание) меняет и воркер
+# планировщика в отдельном процессе, а его сбросы до кэша бота не доходят:
+# время жизни записи ограничивает, сколько бот может показывать устаревшее дело
+CASE_TTL_SECONDS = 30
+
+# Кэши чтения дел и их файлов по id дела
+case_cache = TTLCache(maxsize=4096, ttl=CASE_TTL_SECONDS, name='case')
+case_files_cache = TTLCache(maxsize=4096, ttl=300, name='case_files')
+# Часовые пояса пользователей по id пользователя
+user_tz_cache = TTLCache(maxsize=4096, ttl=300, name='user_tz')
+
+
+def invalidate_case(case_id):
+    """Сбрасывает закэшированное дело после его изменения."""
+    case_cache.invalidate(int(case_id))
+
+
+def invalidate_case_files(case_id=None):
+    """Сбрасывает закэшированные файлы дела (или всех дел, если id не указан)."""
+    if case_id is None:
+        case_files_cache.clear()
+    else:
+        case_files_cache.invalidate(int(case_id))
+
+
+def invalidate_user_tz(user_id):
+    """Сбрасывает закэшированный часовой пояс после его смены."""
+    user_tz_cache.invalidate(str(user_id))
+
+
+def get_cache_stats():
+    return {
+        'case': case_cache.stats(),
+        'case_files': case_files_cache.stats(),
+        'user_tz': user_tz_cache.stats(),
+    }
+
+
+def log_cache_stats():
+    """Пишет в лог счётчики попаданий кэшей (для мониторинга)."""
+    for name, stats in get_cache_stats().items():
+        logger.info(f'Cache {name}: {stats}')
@@ -1,51 +1,198 @@
+import asyncio
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from handler_stats import record_db_time
+from metrics import DB_QUERY_DURATION
+
+
+# Профили движка SQLite (SQLITE_PROFILE). legacy - журнал отката и новое
+# соединение на каждый запрос; wal - прагмы ниже, одно соединение записи
+# и пул соединений только для чтения, которые запись не блокирует
+SQLITE_PROFILES = {
+    'legacy': {},
+    'wal': {
+        'journal_mode': 'WAL',
+        # В режиме WAL сбой питания может потерять последние коммиты, но не испортить базу
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # Отрицательное значение - в КиБ, 64 МиБ на соединение
+        # Ожидание блокировки другим процессом (воркеры планировщика) вместо ошибки
+        'busy_timeout': 5000,
+    },
+}
+DEFAULT_SQLITE_PROFILE = 'wal'
+READ_POOL_SIZE = 4
+
+
+def apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
 
 
 class Database:
-    def __init__(self, db_url):
+    def __init__(self, db_url, profile=DEFAULT_SQLITE_PROFILE, read_pool_size=READ_POOL_SIZE):
         self.session_maker = None
+        self.read_session_maker = None
         self.url = db_url
+        self.profile = profile
+        self.read_pool_size = read_pool_size
         self.engine = None
+        self.read_engine = None
+
+    @property
+    def has_read_pool(self):
+        return self.read_engine is not None and self.read_engine is not self.engine
 
     def connect(self):
         try:
             # Проверяем, существует ли файл базы данных
-            if not os.path.exists('/app/database/database.db'):
-                os.mknod('/app/database/database.db')
+            db_path = make_url(self.url).database
+            if db_path and not os.path.exists(db_path):
+                os.mknod(db_path)
 
-            self.engine = create_engine(self.url)
+            self.engine, self.read_engine = self.create_engines()
             self.session_maker = sessionmaker(bind=self.engine)
+            self.read_session_maker = sessionmaker(bind=self.read_engine)
             self.sql_query(query=select(1))
             logging.info('Database connected')
         except Exception as e:
             logging.error(e)
             logging.error("Database didn't connect")
 
+    def create_engines(self):
+        """Движки записи и чтения; без пула чтения это один и тот же движок."""
+        url = make_url(self.url)
+        pragmas = SQLITE_PROFILES[self.profile]
+        if not pragmas or url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+            engine = create_engine(self.url)
+            return engine, engine
+
+        # Соединения берутся из пула в разных потоках, но не одновременно
+        connect_args = {'check_same_thread': False}
+        # Единственное соединение записи: транзакции записи идут по очереди
+        writer = create_engine(
+            self.url,
+            poolclass=QueuePool,
+            pool_size=1,
+            max_overflow=0,
+            connect_args=connect_args,
+        )
+        reader = create_engine(
+            self.url,
+            poolclass=QueuePool,
+            pool_size=self.read_pool_size,
+            max_overflow=0,
+            connect_args=connect_args,
+        )
+        event.listen(writer, 'connect', partial(apply_pragmas, pragmas))
+        event.listen(reader, 'connect', partial(apply_pragmas, {**pragmas, 'query_only': 'ON'}))
+        return writer, reader
+
     def sql_query(self, query, is_single=True, is_update=False, is_delete=False):
-        with self.session_maker(expire_on_commit=True) as session:
+        kind = 'delete' if is_delete else 'update' if is_update else 'select'
+        session_maker = self.read_session_maker if kind == 'select' else self.session_maker
+        with DB_QUERY_DURATION.labels(kind).time(), session_maker(expire_on_commit=True) as session:
             response = session.execute(query)
             if is_delete or is_update:
                 session.commit()
-            if not is_update and not is_delete:
-                return response.scalars().first() if is_single else response.all()
+                # Число изменённых строк - для условных обновлений
+                return response.rowcount
+            return response.scalars().first() if is_single else response.all()
+
+    def execute_in_transaction(self, statements):
+        """Выполняет пары (запрос, параметры) в одной транзакции.
+
+        Список словарей в параметрах выполняется как executemany.
+        """
+        with DB_QUERY_DURATION.labels('transaction').time(), self.session_maker(expire_on_commit=True) as session:
+            for query, params in statements:
+                session.execute(query, params)
+            session.commit()
 
     def create_object(self, model):
-        with self.session_maker(expire_on_commit=True) as session:
+        with DB_QUERY_DURATION.labels('insert').time(), self.session_maker(expire_on_commit=True) as session:
             session.add(model)
             session.commit()
             session.refresh(model)
             return model.id
 
     def create_objects(self, model_s: []):
-        with self.session_maker(expire_on_commit=True) as session:
+        with DB_QUERY_DURATION.labels('insert').time(), self.session_maker(expire_on_commit=True) as session:
             session.add_all(model_s)
             session.commit()
 
 
+class AsyncDatabase:
+    """Асинхронный интерфейс к Database.
+
+    Запросы выполняются в выделенных потоках, поэтому обработчики и
+    планировщик не блокируют цикл событий на время работы с SQLite.
+    Запись сериализует один поток; чтение при пуле чтения (профиль wal)
+    идёт параллельно в отдельных потоках, иначе - в том же потоке записи.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='database',
+        )
+        self.read_executor = self.executor
+        if database.has_read_pool:
+            self.read_executor = ThreadPoolExecutor(
+                max_workers=database.read_pool_size,
+                thread_name_prefix='database-reader',
+            )
+
+    async def run(self, func, *args, **kwargs):
+        return await self._run_in(self.executor, func, *args, **kwargs)
+
+    async def _run_in(self, executor, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+        finally:
+            # Ожидание вместе с очередью потока - столько база задержала обработчик
+            record_db_time(time.perf_counter() - started)
+
+    async def sql_query(self, query, is_single=True, is_update=False, is_delete=False):
+        executor = self.executor if is_update or is_delete else self.read_executor
+        return await self._run_in(
+            executor,
+            self.database.sql_query,
+            query,
+            is_single=is_single,
+            is_update=is_update,
+            is_delete=is_delete,
+        )
+
+    async def execute_in_transaction(self, statements):
+        return await self.run(self.database.execute_in_transaction, statements)
+
+    async def create_object(self, model):
+        return await self.run(self.database.create_object, model)
+
+    async def create_objects(self, model_s: []):
+        return await self.run(self.database.create_objects, model_s)
+
+
 logging.basicConfig(level=logging.INFO)
-db = Database('sqlite:////app/database/database.db')
+db = Database(
+    os.getenv('DATABASE_URL', 'sqlite:////app/database/database.db'),
+    profile=os.getenv('SQLITE_PROFILE', DEFAULT_SQLITE_PROFILE),
+    read_pool_size=int(os.getenv('DB_READ_POOL_SIZE', str(READ_POOL_SIZE))),
+)
 db.connect()
+async_db = AsyncDatabase(db)
@@ -0,0 +1,85 @@
+import json
+from datetime import timedelta
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import async_db
+from database.models import FSMRecord
+from utils.timezones import utcnow
+
+DIALOG_TTL = timedelta(days=1)  # Через сутки незавершённый диалог считается брошенным
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в основной базе данных.
+
+    Состояния диалогов переживают перезапуск бота. Данные хранятся в JSON,
+    поэтому в состояние можно класть только примитивы (id дел, строки),
+    а не ORM-объекты. Записи старше ttl считаются брошенными и удаляются
+    методом evict_expired.
+    """
+
+    def __init__(self, database=async_db, ttl=DIALOG_TTL):
+        self.database = database
+        self.ttl = ttl
+
+    @staticmethod
+    def build_key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id,
+            key.business_connection_id,
+            key.destiny,
+        ))
+
+    async def _get_record(self, key: StorageKey):
+        return await self.database.sql_query(
+            select(FSMRecord)
+            .where(
+                FSMRecord.key == self.build_key(key),
+                FSMRecord.updated_at >= utcnow() - self.ttl,
+            ),
+            is_single=True,
+        )
+
+    async def _upsert(self, key: StorageKey, **values):
+        values['updated_at'] = utcnow()
+        await self.database.sql_query(
+            insert(FSMRecord)
+            .values(key=self.build_key(key), **values)
+            .on_conflict_do_update(index_elements=[FSMRecord.key], set_=values),
+            is_update=True,
+        )
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self._upsert(key, state=state)
+
+    async def get_state(self, key: StorageKey):
+        record = await self._get_record(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        await self._upsert(key, data=json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey):
+        record = await self._get_record(key)
+        if record is None or not record.data:
+            return {}
+        return json.loads(record.data)
+
+    async def evict_expired(self):
+        """Удаляет брошенные диалоги."""
+        await self.database.sql_query(
+            delete(FSMRecord)
+            .where(FSMRecord.updated_at < utcnow() - self.ttl),
+            is_delete=True,
+        )
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,173 @@
+import logging
+
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+
+from database.models import Base, Cases, SchedulerLease, Users
+from utils.partitions import PARTITIONS_COUNT, get_partition
+from utils.recurrence import rule_for_repeat
+from utils.schedule import compute_next_fire_at
+from utils.timezones import DEFAULT_TZ, to_utc, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Даты дел, которые хранятся в UTC
+UTC_COLUMNS = (
+    'start_date',
+    'deadline_date',
+    'original_deadline',
+    'last_notification',
+    'next_fire_at',
+)
+
+# Индексы, заменённые составными индексами из моделей
+OBSOLETE_INDEXES = ('ix_cases_next_fire_at', 'ix_cases_finished_next_fire_at')
+
+
+def add_missing_columns(engine, skip=()):
+    """Добавляет в существующие таблицы колонки, появившиеся в моделях.
+
+    skip - колонки вида 'таблица.колонка', которые добавляют другие миграции.
+    """
+    with engine.begin() as connection:
+        # Через то же соединение: у движка записи оно единственное
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or f'{table.name}.{column.name}' in skip:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}',
+                ))
+                logger.info(f'Added column {table.name}.{column.name}')
+
+
+def convert_local_times_to_utc(engine):
+    """Переводит даты дел из местного времени контейнера в UTC.
+
+    До появления Users.tz все даты хранились в часовом поясе контейнера
+    (DEFAULT_TZ). Перевод выполняется один раз - для базы, в которой ещё нет
+    колонки users.tz. Колонка добавляется в той же транзакции, поэтому
+    прерванная миграция будет повторена целиком.
+    """
+    if 'tz' in {column['name'] for column in inspect(engine).get_columns('users')}:
+        return
+    with engine.begin() as connection:
+        columns = [Cases.__table__.c[name] for name in UTC_COLUMNS]
+        rows = connection.execute(select(Cases.id, *columns)).all()
+        for case_id, *local_times in rows:
+            connection.execute(
+                update(Cases.__table__)
+                .where(Cases.id == case_id)
+                .values(dict(zip(
+                    UTC_COLUMNS,
+                    (to_utc(local_time, DEFAULT_TZ) for local_time in local_times),
+                ))),
+            )
+        column_type = Users.tz.type.compile(dialect=engine.dialect)
+        connection.execute(text(f'ALTER TABLE users ADD COLUMN tz {column_type}'))
+    logger.info(f'Converted dates of {len(rows)} cases to UTC')
+
+
+def create_missing_indexes(engine):
+    """Создаёт индексы, объявленные в моделях, если их ещё нет."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def drop_obsolete_indexes(engine):
+    """Удаляет индексы, которые больше не объявлены в моделях."""
+    with engine.begin() as connection:
+        for index_name in OBSOLETE_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+
+
+def backfill_rrule(engine):
+    """Заполняет правило повторения для дел, созданных до его появления."""
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select(Cases.id, Cases.repeat)
+            .where(
+                Cases.repeat.is_not(None),
+                Cases.rrule.is_(None),
+            ),
+        ).all()
+        for case_id, repeat in rows:
+            connection.execute(
+                update(Cases)
+                .where(Cases.id == case_id)
+                .values(rrule=rule_for_repeat(repeat)),
+            )
+    if rows:
+        logger.info(f'Backfilled rrule for {len(rows)} cases')
+
+
+def backfill_next_fire_at(engine):
+    """Заполняет next_fire_at для незавершённых дел, созданных до появления колонки."""
+    now = utcnow()
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select(Cases.id, Cases.deadline_date, Cases.rrule, Users.tz)
+            .outerjoin(Users, Users.id == Cases.user_id)
+            .where(
+                Cases.is_finished.is_(False),
+                Cases.next_fire_at.is_(None),
+            ),
+        ).all()
+        for case_id, deadline, rule, tz in rows:
+            connection.execute(
+                update(Cases)
+                .where(Cases.id == case_id)
+                .values(next_fire_at=compute_next_fire_at(deadline, rule, now, tz)),
+            )
+    if rows:
+        logger.info(f'Backfilled next_fire_at for {len(rows)} cases')
+
+
+def backfill_partitions(engine):
+    """Заполняет партицию планировщика для дел, созданных до её появления."""
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select(Cases.id, Cases.user_id)
+            .where(Cases.partition.is_(None)),
+        ).all()
+        for case_id, user_id in rows:
+            connection.execute(
+                update(Cases)
+                .where(Cases.id == case_id)
+                .values(partition=get_partition(user_id)),
+            )
+    if rows:
+        logger.info(f'Backfilled partition for {len(rows)} cases')
+
+
+def create_leases(engine):
+    """Создаёт строки аренды для всех партиций планировщика.
+
+    Миграцию могут одновременно выполнять несколько процессов, поэтому
+    уже существующие строки пропускаются на уровне INSERT.
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            insert(SchedulerLease)
+            .on_conflict_do_nothing(index_elements=[SchedulerLease.partition]),
+            [{'partition': partition} for partition in range(PARTITIONS_COUNT)],
+        )
+
+
+def upgrade(engine):
+    """Приводит схему базы данных к актуальному состоянию моделей."""
+    Base.metadata.create_all(bind=engine)
+    # Перевод в UTC читает и новые колонки дел, а users.tz служит признаком
+    # того, что перевод уже выполнен, - её добавляет сам перевод
+    add_missing_columns(engine, skip={'users.tz'})
+    convert_local_times_to_utc(engine)
+    create_missing_indexes(engine)
+    drop_obsolete_indexes(engine)
+    backfill_rrule(engine)
+    backfill_next_fire_at(engine)
+    backfill_partitions(engine)
+    create_leases(engine)
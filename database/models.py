@@ -1,4 +1,14 @@
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    text,
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -12,26 +22,129 @@ class Users(Base):
     username = Column(String(100))
     first_name = Column(String(100))
     last_name = Column(String(100))
+    # Часовой пояс IANA (например, 'Europe/Moscow'), NULL - DEFAULT_TZ
+    tz = Column(String(64))
+    # Напоминания, сработавшие одновременно, приходят одним сообщением
+    digest = Column(Boolean, default=False)
 
 
 class Cases(Base):
     __tablename__ = 'cases'
+    __table_args__ = (
+        # Списки /active_cases, /finished_cases, /today_cases
+        Index('ix_cases_user_finished_deadline', 'user_id', 'is_finished', 'deadline_date'),
+        Index(
+            'ix_cases_user_finished_original_deadline',
+            'user_id',
+            'is_finished',
+            'original_deadline',
+        ),
+        # Повторяющиеся дела, срабатывающие сегодня (/today_cases)
+        Index('ix_cases_user_finished_next_fire_at', 'user_id', 'is_finished', 'next_fire_at'),
+        # Выборка ближайших напоминаний планировщиком по его партициям
+        Index(
+            'ix_cases_finished_partition_next_fire_at',
+            'is_finished',
+            'partition',
+            'next_fire_at',
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(String(100), ForeignKey('users.id'))
     name = Column(String(100))
+    # Все даты дела хранятся в UTC без tzinfo (см. utils/timezones.py)
     start_date = Column(DateTime, nullable=False)
     description = Column(String(100))
     deadline_date = Column(DateTime, nullable=True)
-    repeat = Column(String(100))  # 'Ежедневно', 'Еженедельно', 'Ежемесячно' или NULL
+    repeat = Column(String(100))  # Подпись варианта повторения для пользователя или NULL
+    # Правило повторения RRULE без DTSTART (см. utils/recurrence.py), NULL — без повтора
+    rrule = Column(String(100))
     is_finished = Column(Boolean, default=False)
     last_notification = Column(DateTime)  # Добавляем новое поле
     original_deadline = Column(DateTime)  # Добавляем новое поле
+    # Ближайшее время срабатывания напоминания (NULL — срабатывать не нужно)
+    next_fire_at = Column(DateTime, nullable=True)
+    # Партиция планировщика (см. utils/partitions.py и leases.py)
+    partition = Column(Integer)
 
 
 class File(Base):  # noqa: WPS110
     __tablename__ = 'file'
     id = Column(Integer, primary_key=True)
-    case_id = Column(Integer, ForeignKey('cases.id'))
+    case_id = Column(Integer, ForeignKey('cases.id'), index=True)
     file_name = Column(String(100))
     file_url = Column(String(100))
+    # file_id из ответа Telegram: повторные отправки не читают файл с диска
+    telegram_file_id = Column(String(200))
+    # Ключ хранилища вложений (см. file_store.py), общий для одинаковых файлов
+    file_unique_id = Column(String(100), index=True)
+
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_state'
+
+    key = Column(String(200), primary_key=True)
+    state = Column(String(100))
+    data = Column(Text)  # JSON с примитивными значениями
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+
+class SchedulerLease(Base):
+    __tablename__ = 'scheduler_lease'
+
+    partition = Column(Integer, primary_key=True)
+    owner = Column(String(200))  # NULL - партиция свободна
+    expires_at = Column(DateTime)
+    # Водяной знак: напоминания партиции со временем до него уже обработаны
+    last_tick_at = Column(DateTime)
+
+
+class SchedulerWorker(Base):
+    __tablename__ = 'scheduler_worker'
+
+    id = Column(String(200), primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)
+
+
+class ReminderOutbox(Base):
+    """Напоминания к отправке (см. outbox.py).
+
+    Строка добавляется в одной транзакции с переносом или завершением дела,
+    поэтому напоминание не теряется при падении процесса до отправки.
+    """
+
+    __tablename__ = 'reminder_outbox'
+    __table_args__ = (
+        # Срабатывание дела ставится в очередь не больше одного раза
+        Index(
+            'ux_reminder_outbox_pending_case_due',
+            'case_id',
+            'due_at',
+            unique=True,
+            sqlite_where=text("status = 'pending'"),
+        ),
+        # Выборка готовых к отправке сообщений своих партиций
+        Index(
+            'ix_reminder_outbox_status_partition_next_attempt',
+            'status',
+            'partition',
+            'next_attempt_at',
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # Без внешнего ключа: сообщение доставляется и после удаления дела
+    case_id = Column(Integer, nullable=False)
+    user_id = Column(String(100), nullable=False)
+    partition = Column(Integer)
+    due_at = Column(DateTime, nullable=False)  # Время срабатывания (UTC)
+    text = Column(Text, nullable=False)
+    missed = Column(Boolean, default=False)  # Отправлено догоняющим тиком после простоя
+    digest = Column(Boolean, default=False)  # Объединяется с другими напоминаниями пользователя
+    status = Column(String(20), nullable=False)  # pending, sent или failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String(500))
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
@@ -0,0 +1,111 @@
+import logging
+import re
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from database.models import File
+from handlers.active_cases import today_cases_query
+from handlers.pagination import cases_page_query
+from outbox import outbox_relay
+from scheduler import ReminderQueue, missed_cases_query
+from utils.timezones import utcnow
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS = (0, 1, 2)
+
+
+def get_hot_queries():
+    """Запросы, выполняемые на каждое обновление или тик планировщика.
+
+    Запросы строятся теми же функциями, что и в коде бота. Значение -
+    пара (запрос, колонки): план должен ограничивать каждую колонку по
+    индексу диапазоном, а не читать все строки префикса индекса (для
+    запросов без колонок поиска по префиксу достаточно).
+    """
+    now = utcnow()
+    cursor = (now, 0)
+    queue = ReminderQueue()
+    queue.partitions = frozenset(PARTITIONS)
+    return {
+        # handlers/pagination.py::get_cases_page
+        'cases_page': (cases_page_query('0', False), ()),
+        'cases_page_next': (cases_page_query('0', False, cursor), ('deadline_date',)),
+        'cases_page_prev': (
+            cases_page_query('0', True, cursor, backwards=True),
+            ('deadline_date',),
+        ),
+        # handlers/active_cases.py::get_today_cases
+        'today_cases': (
+            today_cases_query('0', now, now + timedelta(days=1)),
+            ('deadline_date', 'original_deadline', 'next_fire_at'),
+        ),
+        # scheduler.py::ReminderQueue.refill
+        'scheduler_refill': (queue.window_query(now, now + queue.lookahead), ('next_fire_at',)),
+        # scheduler.py::catch_up_missed_reminders
+        'catch_up': (missed_cases_query(PARTITIONS, now), ('next_fire_at',)),
+        # outbox.py::OutboxRelay.fetch_ready
+        'outbox_ready': (outbox_relay.ready_query(PARTITIONS), ('next_attempt_at',)),
+        # handlers/active_cases.py::get_case_files
+        'case_files': (select(File).where(File.case_id == 0), ()),
+    }
+
+
+def explain(connection, query):
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса."""
+    # render_postcompile раскрывает параметры IN (...) в отдельные позиции
+    compiled = query.compile(
+        dialect=connection.dialect,
+        compile_kwargs={'render_postcompile': True},
+    )
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', positional).all()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(plan_step):
+    return plan_step.startswith('SCAN') and 'INDEX' not in plan_step
+
+
+def constrains_range(plan_step, column):
+    """Ограничивает ли шаг SEARCH значения column по индексу.
+
+    Диапазон виден в плане как column>? или column<?, сравнение кортежей
+    курсора - как (column,...)>(?,...).
+    """
+    return (
+        plan_step.startswith('SEARCH')
+        and re.search(rf'[(\s]{column}(?:[<>=]|,[^)]*\)[<>])', plan_step) is not None
+    )
+
+
+def find_unconstrained_columns(plan, columns):
+    """Колонки из columns, которые ни один шаг плана не ограничивает."""
+    return [
+        column for column in columns
+        if not any(constrains_range(step, column) for step in plan)
+    ]
+
+
+def find_unindexed_queries(engine):
+    """Возвращает {имя запроса: план} для запросов без нужного индекса.
+
+    Такими считаются запросы, читающие таблицу целиком, и запросы, план
+    которых не ограничивает колонку диапазона, а читает все строки
+    префикса индекса.
+    """
+    unindexed = {}
+    with engine.connect() as connection:
+        for name, (query, columns) in get_hot_queries().items():
+            plan = explain(connection, query)
+            if any(is_full_scan(step) for step in plan) or find_unconstrained_columns(plan, columns):
+                unindexed[name] = plan
+    return unindexed
+
+
+def check_query_plans(engine):
+    """Предупреждает в логе о горячих запросах без индекса (см. tests/test_query_plans.py)."""
+    for name, plan in find_unindexed_queries(engine).items():
+        logger.warning(f'Query {name} does not search its range by an index: {plan}')
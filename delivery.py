@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram Bot API
+GLOBAL_RATE_PER_SECOND = 30  # Не больше ~30 сообщений в секунду на бота
+PER_CHAT_RATE_PER_SECOND = 1  # Не больше ~1 сообщения в секунду в один чат
+DELIVERY_WORKERS = 16
+MAX_ATTEMPTS = 5
+MAX_IDLE_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Ограничитель частоты по алгоритму token bucket."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or 1
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def pause(self, seconds):
+        """Запрещает выдачу токенов на seconds секунд (ответ RetryAfter)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Через сколько секунд появится токен (0 - есть сейчас)."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        """Забирает токен, если он есть, не дожидаясь его."""
+        if self.delay():
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        """Ожидает и забирает один токен.
+
+        Проверка и списание выполняются без переключения задач, поэтому
+        блокировка не нужна, и ожидающие не задерживают друг друга сверх лимита.
+        """
+        while not self.try_acquire():
+            await asyncio.sleep(self.delay())
+
+    def is_idle(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class OutgoingMessage:
+    __slots__ = ('chat_id', 'kwargs', 'attempt', 'tag')
+
+    def __init__(self, chat_id, kwargs, tag=None):
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.attempt = 0
+        self.tag = tag
+
+
+class DeliveryPool:
+    """Пул асинхронных воркеров, отправляющих сообщения с учётом лимитов Telegram.
+
+    Сообщения ставятся в очередь своего чата через send_message, а воркеры
+    берут чаты из очереди готовых. Чат попадает в неё, когда его token
+    bucket выдаст токен, поэтому воркер не ждёт лимита одного чата, и чат с
+    длинной очередью не задерживает остальные; сообщения одного чата уходят
+    по порядку. Общий token bucket удерживает суммарную частоту, а
+    RetryAfter приостанавливает отправку на указанное Telegram время.
+
+    Если при запуске передан on_result, он вызывается с меткой сообщения и
+    ошибкой (None при успехе) после окончательного результата отправки.
+    """
+
+    def __init__(
+            self,
+            workers=DELIVERY_WORKERS,
+            global_rate=GLOBAL_RATE_PER_SECOND,
+            per_chat_rate=PER_CHAT_RATE_PER_SECOND,
+    ):
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = {}
+        # Очереди чатов с неотправленными сообщениями; чат из этого словаря
+        # либо ждёт в ready_chats (или таймера), либо обрабатывается воркером
+        self.chat_queues = {}
+        self.ready_chats = asyncio.Queue()
+        self.bot = None
+        self.on_result = None
+        self.sent = 0
+        self.failed = 0
+        self._pending = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = []
+
+    @property
+    def is_running(self):
+        return bool(self._tasks)
+
+    def start(self, bot, on_result=None):
+        """Запускает воркеры, отправляющие сообщения от имени bot."""
+        self.bot = bot
+        self.on_result = on_result
+        self._tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Дожидается отправки очереди и останавливает воркеры."""
+        await self._drained.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def send_message(self, chat_id, tag=None, **kwargs):
+        """Ставит сообщение в очередь на отправку; tag передаётся в on_result."""
+        if not self.is_running:
+            raise RuntimeError('Delivery pool is not started')
+        message = OutgoingMessage(chat_id, kwargs, tag)
+        self._pending += 1
+        self._drained.clear()
+        chat_queue = self.chat_queues.get(chat_id)
+        if chat_queue is None:
+            self.chat_queues[chat_id] = deque((message,))
+            self._schedule_chat(chat_id)
+        else:
+            chat_queue.append(message)
+
+    def _schedule_chat(self, chat_id):
+        """Ставит чат в очередь готовых, когда его лимит позволит отправку."""
+        delay = self._chat_bucket(chat_id).delay()
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self.ready_chats.put_nowait, chat_id)
+        else:
+            self.ready_chats.put_nowait(chat_id)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._evict_idle_buckets()
+            bucket = TokenBucket(self.per_chat_rate)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _evict_idle_buckets(self):
+        self.chat_buckets = {
+            chat_id: bucket
+            for chat_id, bucket in self.chat_buckets.items()
+            if chat_id in self.chat_queues or not bucket.is_idle()
+        }
+
+    async def _worker(self):
+        while True:
+            chat_id = await self.ready_chats.get()
+            # Таймер мог сработать чуть раньше, чем появился токен
+            if not self._chat_bucket(chat_id).try_acquire():
+                self._schedule_chat(chat_id)
+                continue
+            chat_queue = self.chat_queues[chat_id]
+            message = chat_queue.popleft()
+            try:
+                await self._deliver(message, chat_queue)
+            finally:
+                if chat_queue:
+                    self._schedule_chat(chat_id)
+                else:
+                    del self.chat_queues[chat_id]
+
+    async def _deliver(self, message, chat_queue):
+        await self.global_bucket.acquire()
+        message.attempt += 1
+        try:
+            await self.bot.send_message(chat_id=message.chat_id, **message.kwargs)
+        except TelegramRetryAfter as e:
+            logger.warning(
+                f'Flood control for chat {message.chat_id}: '
+                f'retry after {e.retry_after}s',
+            )
+            self.global_bucket.pause(e.retry_after)
+            if message.attempt < MAX_ATTEMPTS:
+                # Первым в очереди своего чата, чтобы не нарушить порядок
+                chat_queue.appendleft(message)
+            else:
+                self._finish(message, e)
+        except Exception as e:
+            # Любая ошибка касается только этого сообщения, воркер продолжает работу
+            logger.error(f'Failed to send message to chat {message.chat_id}: {e}')
+            self._finish(message, e)
+        else:
+            self._finish(message, None)
+
+    def _finish(self, message, error):
+        if error is None:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self._pending -= 1
+        if not self._pending:
+            self._drained.set()
+        if self.on_result is not None:
+            self.on_result(message.tag, error)
+
+
+delivery_pool = DeliveryPool()
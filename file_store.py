@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+
+from aiogram.exceptions import TelegramAPIError
+from sqlalchemy import func, select, update
+
+from database.db import async_db
+from database.models import File
+
+logger = logging.getLogger(__name__)
+
+STORE_ROOT = os.path.join('tmp', 'files')
+
+
+def attachment_from_message(message):
+    """Описание вложения из сообщения пользователя (или None, если вложения нет).
+
+    Сохраняются только идентификаторы Telegram: сам файл скачивается
+    лениво, когда его байты действительно понадобятся.
+    """
+    if message.document:
+        document = message.document
+        return {
+            'file_name': document.file_name or document.file_unique_id,
+            'telegram_file_id': document.file_id,
+            'file_unique_id': document.file_unique_id,
+        }
+    if message.photo:
+        photo = message.photo[-1]
+        return {
+            'file_name': f'photo_{photo.file_unique_id}.jpg',
+            'telegram_file_id': photo.file_id,
+            'file_unique_id': photo.file_unique_id,
+        }
+    return None
+
+
+def describe_uploaded(attachments):
+    """Текст подтверждения загрузки одного или нескольких вложений."""
+    file_names = ', '.join(attachment['file_name'] for attachment in attachments)
+    if len(attachments) == 1:
+        return f'Файл {file_names} успешно загружен'
+    return f'Файлы {file_names} успешно загружены'
+
+
+def make_file(attachment, case_id):
+    """Строка File для вложения из состояния диалога."""
+    return File(
+        case_id=case_id,
+        file_name=attachment['file_name'],
+        telegram_file_id=attachment['telegram_file_id'],
+        file_unique_id=attachment['file_unique_id'],
+    )
+
+
+class FileStore:
+    """Хранилище вложений, адресуемое по file_unique_id Telegram.
+
+    Одинаковые файлы (с одним file_unique_id) хранятся на диске один раз
+    в шардированных каталогах. Счётчиком ссылок служат строки File с этим
+    file_unique_id: когда последняя из них удалена, удаляется и файл.
+    """
+
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+
+    def path_for(self, file_unique_id):
+        digest = hashlib.sha1(file_unique_id.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], file_unique_id)
+
+    async def ensure_local(self, bot, user_file):
+        """Возвращает путь к файлу на диске, при необходимости скачивая его."""
+        if user_file.file_url and os.path.exists(user_file.file_url):
+            return user_file.file_url
+        if not user_file.file_unique_id or not user_file.telegram_file_id:
+            return None
+
+        path = self.path_for(user_file.file_unique_id)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial_path = f'{path}.part'
+            try:
+                file_info = await bot.get_file(user_file.telegram_file_id)
+                await bot.download_file(file_info.file_path, partial_path)
+            except TelegramAPIError as e:
+                logger.error(f'Failed to download file {user_file.file_unique_id}: {e}')
+                return None
+            os.replace(partial_path, path)
+
+        await async_db.sql_query(
+            update(File)
+            .where(File.file_unique_id == user_file.file_unique_id)
+            .values(file_url=path),
+            is_update=True,
+        )
+        return path
+
+    async def release(self, file_unique_ids):
+        """Удаляет с диска файлы, на которые больше не ссылается ни одна строка File."""
+        for file_unique_id in set(filter(None, file_unique_ids)):
+            references = await async_db.sql_query(
+                select(func.count(File.id))
+                .where(File.file_unique_id == file_unique_id),
+                is_single=True,
+            )
+            path = self.path_for(file_unique_id)
+            if not references and os.path.exists(path):
+                os.remove(path)
+
+
+file_store = FileStore()
@@ -31,6 +31,14 @@ class CurrentCaseCallBack(CallbackData, prefix='cur_case'):
     case_id: int
 
 
+# Перелистывание списка дел: курсор (deadline_date, id) граничного дела страницы
+class CasesPageCallback(CallbackData, prefix='cases_page'):
+    is_finished: bool
+    backwards: bool
+    deadline: str
+    case_id: int
+
+
 class ManageCaseCallback(CallbackData, prefix='manage_case'):
     action: str
     case_id: int
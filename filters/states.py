@@ -9,6 +9,7 @@ class NewCaseStates(StatesGroup):
     select_date = State()
     select_time = State()
     set_repeat = State()
+    set_repeat_interval = State()
     add_attachments = State()
     set_files = State()
     set_case_type = State()
@@ -25,6 +26,7 @@ class EditCaseStates(StatesGroup):
     editing_files = State()
     waiting_for_new_date = State()
     waiting_for_new_repeat = State()
+    waiting_for_repeat_interval = State()
     waiting_for_field_choice = State()
     waiting_for_new_value = State()
     awaiting_new_time = State()
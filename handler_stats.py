@@ -0,0 +1,169 @@
+"""Замеры обработчиков обновлений: время, ожидание базы и вызовы Bot API.
+
+Внешний middleware обновлений засекает время обработки, внутренний узнаёт,
+какой обработчик сработал, а middleware сессии Bot считает запросы к API.
+Время ожидания базы добавляет AsyncDatabase (database/db.py). Данные
+текущего обновления передаются через contextvar задачи обработки.
+
+Медленные обновления пишутся в лог. Если задан PROFILE_SAMPLE_RATE, доля
+обновлений выполняется под cProfile, и профили медленных из них
+сохраняются в PROFILE_DIR для просмотра через pstats или snakeviz.
+"""
+import cProfile
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SLOW_UPDATE_MS = 1000
+PROFILE_DIR = 'tmp/profiles'
+UNHANDLED = 'unhandled'
+
+_current_update = ContextVar('current_update', default=None)
+
+
+class UpdateTiming:
+    """Замеры одного обновления."""
+
+    __slots__ = ('handler', 'db_time', 'api_calls')
+
+    def __init__(self):
+        self.handler = UNHANDLED
+        self.db_time = 0.0
+        self.api_calls = 0
+
+
+class HandlerTotals:
+    """Накопленные замеры одного обработчика."""
+
+    __slots__ = ('count', 'total_time', 'max_time', 'db_time', 'api_calls', 'slow')
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.db_time = 0.0
+        self.api_calls = 0
+        self.slow = 0
+
+
+def record_db_time(seconds):
+    """Добавляет время ожидания базы к текущему обновлению, если оно есть."""
+    timing = _current_update.get()
+    if timing is not None:
+        timing.db_time += seconds
+
+
+def handler_name(handler):
+    callback = handler.callback
+    module = callback.__module__.rsplit('.', 1)[-1]
+    return f'{module}.{callback.__name__}'
+
+
+class HandlerStats:
+    """Статистика обработчиков с момента запуска процесса.
+
+    slow_ms - порог медленного обновления, sample_rate - доля обновлений,
+    выполняемых под профилировщиком (0 - профилирование выключено).
+    """
+
+    def __init__(self, slow_ms=SLOW_UPDATE_MS, sample_rate=0.0, profile_dir=PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+        self.handlers = {}
+        self._profiling = False
+
+    def setup(self, dispatcher, bot):
+        """Подключает middleware к диспетчеру и сессии bot."""
+        dispatcher.update.outer_middleware(self.update_middleware)
+        # Внутренние middleware диспетчера действуют во всех вложенных роутерах
+        dispatcher.message.middleware(self.handler_middleware)
+        dispatcher.callback_query.middleware(self.handler_middleware)
+        bot.session.middleware(self.request_middleware)
+
+    async def update_middleware(self, handler, event, data):
+        timing = UpdateTiming()
+        token = _current_update.set(timing)
+        profiler = self._start_profiler()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_update.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            is_slow = elapsed * 1000 >= self.slow_ms
+            self.record(timing, elapsed, is_slow)
+            if is_slow:
+                logger.warning(
+                    f'Slow update {event.update_id} in {timing.handler}: '
+                    f'{elapsed * 1000:.0f} ms, DB {timing.db_time * 1000:.0f} ms, '
+                    f'{timing.api_calls} API calls',
+                )
+                if profiler is not None:
+                    self._dump_profile(profiler, event.update_id, timing.handler, elapsed)
+
+    async def handler_middleware(self, handler, event, data):
+        timing = _current_update.get()
+        if timing is not None:
+            timing.handler = handler_name(data['handler'])
+        return await handler(event, data)
+
+    async def request_middleware(self, make_request, bot, method):
+        timing = _current_update.get()
+        if timing is not None:
+            timing.api_calls += 1
+        return await make_request(bot, method)
+
+    def record(self, timing, elapsed, is_slow=False):
+        totals = self.handlers.get(timing.handler)
+        if totals is None:
+            totals = HandlerTotals()
+            self.handlers[timing.handler] = totals
+        totals.count += 1
+        totals.total_time += elapsed
+        totals.max_time = max(totals.max_time, elapsed)
+        totals.db_time += timing.db_time
+        totals.api_calls += timing.api_calls
+        totals.slow += is_slow
+
+    def top(self, limit=10):
+        """Обработчики с наибольшим суммарным временем: список (имя, итоги)."""
+        return sorted(
+            self.handlers.items(),
+            key=lambda item: item[1].total_time,
+            reverse=True,
+        )[:limit]
+
+    def _start_profiler(self):
+        # Профилировщик в потоке может быть только один, и он видит все
+        # корутины, выполняющиеся параллельно с профилируемым обновлением
+        if self._profiling or not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        self._profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _dump_profile(self, profiler, update_id, name, elapsed):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(
+            self.profile_dir,
+            f'{datetime.now():%Y%m%d-%H%M%S}_{update_id}_{name}_{elapsed * 1000:.0f}ms.prof',
+        )
+        profiler.dump_stats(path)
+        logger.warning(f'Profile of the slow update saved to {path}')
+
+
+handler_stats = HandlerStats(
+    slow_ms=float(os.getenv('SLOW_UPDATE_MS', str(SLOW_UPDATE_MS))),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    profile_dir=os.getenv('PROFILE_DIR', PROFILE_DIR),
+)
@@ -1,5 +1,4 @@
 import logging
-import os
 from datetime import datetime
 
 from aiogram import Bot, F, Router
@@ -10,9 +9,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
-from sqlalchemy import delete, select, update, func
-
-from sqlalchemy import or_
+from sqlalchemy import delete, select, union_all, update
 
 from attachments.keyboards import (
     create_case_editing_keyboard,
@@ -20,10 +17,18 @@ from attachments.keyboards import (
     create_cases_keyboard,
     create_files_keyboard,
     get_repeat_keyboard,
+    remove_case_buttons,
+)
+from database.cache import (
+    case_cache,
+    case_files_cache,
+    invalidate_case,
+    invalidate_case_files,
 )
-from database.db import db
+from database.db import async_db
 from database.models import Cases, File
 from filters.callback_data import (
+    CasesPageCallback,
     FileCallback,
     CurrentCaseCallBack,
     ManageCaseCallback,
@@ -31,10 +36,30 @@ from filters.callback_data import (
     RepeatCallback,
     ManageSendingCaseCallback,
 )
+from file_store import (
+    attachment_from_message,
+    describe_uploaded,
+    file_store,
+    make_file,
+)
 from filters.states import CurrentCasesStates, EditCaseStates
 from handlers.messages import FIELD_NAMES
+from handlers.pagination import build_cases_page_keyboard
+from handlers.user import get_user_tz
+from scheduler import reminder_queue
 
 from utils.markdown_utils import escape_markdown
+from utils.media_group import media_groups
+from utils.recurrence import (
+    MAX_INTERVAL_DAYS,
+    REPEAT_EVERY_N_DAYS,
+    REPEAT_NONE,
+    every_n_days,
+    parse_interval,
+    rule_for_repeat,
+)
+from utils.schedule import compute_next_fire_at, get_day_bounds
+from utils.timezones import DISPLAY_FORMAT, format_local, to_local, to_utc, utcnow
 
 logger = logging.getLogger(__name__)
 
@@ -42,22 +67,58 @@ router = Router()
 
 
 # Helper functions to reduce repeated expressions
-def get_case_by_id(case_id):
-    """Get a case by its ID."""
-    return db.sql_query(
-        select(Cases)
-        .where(Cases.id == case_id),
-        is_single=True,
-    )
+async def get_case_by_id(case_id):
+    """Get a case by its ID (cached, see database/cache.py)."""
+    case = case_cache.get(int(case_id))
+    if case is None:
+        # Изменение дела во время чтения не даст закэшировать старую строку
+        generation = case_cache.generation(int(case_id))
+        case = await async_db.sql_query(
+            select(Cases)
+            .where(Cases.id == case_id),
+            is_single=True,
+        )
+        if case is not None:
+            case_cache.set(case.id, case, generation)
+    return case
+
+
+async def get_case_files(case_id):
+    """Get files associated with a case (cached, see database/cache.py)."""
+    files = case_files_cache.get(int(case_id))
+    if files is None:
+        generation = case_files_cache.generation(int(case_id))
+        files = await async_db.sql_query(
+            select(File)
+            .where(File.case_id == case_id),
+            is_single=False,
+        )
+        case_files_cache.set(int(case_id), files, generation)
+    return files
 
 
-def get_case_files(case_id):
-    """Get files associated with a case."""
-    return db.sql_query(
-        select(File)
-        .where(File.case_id == case_id),
-        is_single=False,
+def today_cases_query(user_id, day_start, day_end):
+    """Active cases of a user due in [day_start, day_end) (UTC).
+
+    A case is due today by deadline_date, original_deadline or, for
+    repeating cases, by its next reminder time. Each condition is a range
+    scan over its own index; an OR of them is planned as a scan over all
+    active cases of the user unless the database has ANALYZE statistics.
+    """
+    def due_between(column):
+        return select(Cases.id).where(
+            Cases.user_id == user_id,
+            Cases.is_finished == False,  # noqa: E712
+            column >= day_start,
+            column < day_end,
+        )
+
+    today_ids = union_all(
+        due_between(Cases.deadline_date),
+        due_between(Cases.original_deadline),
+        due_between(Cases.next_fire_at),
     )
+    return select(Cases).where(Cases.id.in_(today_ids)).order_by(Cases.deadline_date)
 
 
 def create_cases_update_query(case_id):
@@ -65,28 +126,35 @@ def create_cases_update_query(case_id):
     return update(Cases).where(Cases.id == case_id)
 
 
-def update_case(case_id, **case_fields):
+async def update_case(case_id, **case_fields):
     """Update a case with the given values."""
-    db.sql_query(
+    await async_db.sql_query(
         create_cases_update_query(case_id).values(**case_fields),
         is_update=True,
     )
+    invalidate_case(case_id)
+    if 'next_fire_at' in case_fields and case_fields['next_fire_at'] is None:
+        # Завершённое дело больше не срабатывает
+        reminder_queue.cancel(case_id)
+
+
+async def reschedule_case(case_id, deadline, rule, **case_fields):
+    """Update a case and recompute its next reminder time (deadline is UTC)."""
+    case = await get_case_by_id(case_id)
+    tz = await get_user_tz(case.user_id)
+    next_fire_at = compute_next_fire_at(deadline, rule, utcnow(), tz)
+    await update_case(case_id, next_fire_at=next_fire_at, **case_fields)
+    reminder_queue.reschedule(case_id, next_fire_at, case.partition)
 
 
 @router.message(Command('active_cases'))
 async def get_current_cases(message: Message, state: FSMContext, bot: Bot):
     await state.clear()
-    cases = db.sql_query(
-        select(Cases)
-        .where(
-            Cases.user_id == str(message.from_user.id),
-            Cases.is_finished == False,  # noqa: E712
-        )
-        .order_by(Cases.deadline_date),
-        is_single=False,
+    cases_keyboard = await build_cases_page_keyboard(
+        str(message.from_user.id),
+        is_finished=False,
     )
-    cases_keyboard = create_cases_keyboard(cases)
-    if cases:
+    if cases_keyboard:
         await bot.send_message(
             chat_id=message.from_user.id,
             text='Ваши текущие напоминания',
@@ -100,23 +168,39 @@ async def get_current_cases(message: Message, state: FSMContext, bot: Bot):
         )
 
 
+@router.callback_query(CasesPageCallback.filter(F.is_finished == False))  # noqa: E712
+async def turn_current_cases_page(
+        query: CallbackQuery,
+        callback_data: CasesPageCallback,
+        state: FSMContext,
+):
+    cases_keyboard = await build_cases_page_keyboard(
+        str(query.from_user.id),
+        is_finished=False,
+        callback_data=callback_data,
+    )
+    if cases_keyboard is None:
+        await query.answer(text='Больше напоминаний нет')
+        return
+    await query.message.edit_reply_markup(reply_markup=cases_keyboard)
+    await query.answer()
+    await state.set_state(CurrentCasesStates.get_current_cases)
+
+
 @router.message(Command('today_cases'))
 async def get_today_cases(message: Message, state: FSMContext, bot: Bot):
-    cases = db.sql_query(
-        select(Cases)
-        .where(
-            Cases.user_id == str(message.from_user.id),
-            Cases.is_finished == False,  # noqa: E712
-            # Проверяем как deadline_date, так и original_deadline
-            or_(
-                func.date(Cases.deadline_date) == datetime.today().date(),
-                func.date(Cases.original_deadline) == datetime.today().date()
-            )
-        ),
+    user_id = str(message.from_user.id)
+    tz = await get_user_tz(user_id)
+    # Границы сегодняшнего дня пользователя в UTC
+    day_start, day_end = get_day_bounds(to_local(utcnow(), tz).date(), tz)
+    # Повторяющиеся дела, сработавшие сегодня, как и завершённые
+    # неповторяющиеся, в список не попадают
+    cases = await async_db.sql_query(
+        today_cases_query(user_id, day_start, day_end),
         is_single=False,
     )
     if cases:
-        cases_keyboard = create_cases_keyboard(cases)
+        cases_keyboard = create_cases_keyboard(cases, tz)
         await bot.send_message(
             chat_id=message.from_user.id,
             text='Ваши напоминания на сегодня',
@@ -142,11 +226,13 @@ async def show_case_info(
     if prev_msg_id:
         await bot.delete_message(chat_id=chat_id, message_id=prev_msg_id)
 
-    case = get_case_by_id(case_id)
-    await state.update_data(case=case)
+    case = await get_case_by_id(case_id)
+    # В состоянии храним только примитивы, а не ORM-объект
+    await state.update_data(case_name=case.name)
+    tz = await get_user_tz(case.user_id)
 
     reminders_msg = '\n'.join([
-        f'Дата: {case.deadline_date}',
+        f'Дата: {format_local(case.deadline_date, tz)}',
         f'Название: {case.name}',
         f'Описание: {case.description}',
         f'Повторение: {case.repeat}',
@@ -191,8 +277,8 @@ async def show_files(
 ):
     case_id = callback_data.case_id
     state_data = await state.get_data()
-    name = escape_markdown(state_data.get('case').name)
-    files = get_case_files(case_id)
+    name = escape_markdown(state_data.get('case_name'))
+    files = await get_case_files(case_id)
     if files:
         files_keyboard = create_files_keyboard(files)
         await bot.send_message(
@@ -222,9 +308,9 @@ async def complete_case(
         message_id=query.message.message_id,
     )
     state_data = await state.get_data()
-    name = escape_markdown(state_data.get('case').name)
+    name = escape_markdown(state_data.get('case_name'))
     case_id = callback_data.case_id
-    update_case(case_id, is_finished=True)
+    await update_case(case_id, is_finished=True, next_fire_at=None)
     await bot.send_message(
         chat_id=query.from_user.id,
         text=f'Событие _{name}_ отмечено как выполненное',
@@ -244,10 +330,10 @@ async def edit_case(
 ):
     case_id = callback_data.case_id
     settings = create_case_editing_keyboard(case_id=case_id)
-    case = get_case_by_id(case_id)
-    await state.update_data(case=case)
+    case = await get_case_by_id(case_id)
+    await state.update_data(case_name=case.name)
     state_data = await state.get_data()
-    name = escape_markdown(state_data.get('case').name)
+    name = escape_markdown(state_data.get('case_name'))
     await bot.send_message(
         chat_id=query.from_user.id,
         text=f'Редактирование напоминания: _{name}_',
@@ -304,19 +390,19 @@ async def update_case_field(message: Message, state: FSMContext, bot: Bot):
     state_data = await state.get_data()
     case_id = state_data['case_id']
     field = state_data['field']
-    name = escape_markdown(state_data.get('case').name)
+    name = escape_markdown(state_data.get('case_name'))
 
     if field == 'name':
         new_value = message.text.strip()
         if is_valid_text(new_value):
-            update_case(case_id, name=new_value)
+            await update_case(case_id, name=new_value)
             await message.answer(text='Название напоминания было обновлено')
         else:
             await message.answer(text='Введите корректное название')
     elif field == 'description':
         new_value = message.text.strip()
         if is_valid_text(new_value):
-            update_case(case_id, description=new_value)
+            await update_case(case_id, description=new_value)
             await message.answer(text=f'Описание напоминания _{name}_ было обновлено')
         else:
             await message.answer(text='Введите корректное описание')
@@ -326,43 +412,34 @@ async def update_case_field(message: Message, state: FSMContext, bot: Bot):
 
 @router.message(EditCaseStates.editing_files)
 async def receive_new_files(message: Message, state: FSMContext):
+    # Альбом целиком обрабатывает его первое сообщение
+    album = await media_groups.collect(message)
+    if album is None:
+        return
     state_data = await state.get_data()
     case_id = state_data['case_id']
     many_files = state_data.get('many_files', False)
-
-    if message.document or message.photo:
-        if not os.path.exists('tmp'):
-            os.makedirs('tmp')
-
-        file_info = None
-        file_name = None
-
-        if message.document:
-            file_info = await message.bot.get_file(message.document.file_id)
-            file_name = message.document.file_name
-        elif message.photo:
-            file_info = await message.bot.get_file(message.photo[-1].file_id)
-            file_name = f'photo_{file_info.file_unique_id}.jpg'
-
-        if file_info and file_name:
-            file_path = os.path.join('tmp', file_name)
-            await message.bot.download_file(file_info.file_path, file_path)
-
-            # Сохраняем информацию о файле во временное хранилище
-            attachments = state_data.get('attachments', [])
-            attachments.append(f'{file_name}@@@{file_path}')
-            await state.update_data(attachments=attachments)
-
-            await message.answer(f'Файл {file_name} успешно загружен')
-
-            if not many_files:
-                await state.update_data(many_files=True)
-                await message.answer(
-                    'Теперь можете загрузить ещё файлы или завершить процесс'
-                    ', нажав соответствующую кнопку',
-                    # noqa: E501
-                    reply_markup=get_done_editing_files_keyboard(case_id),
-                )
+    # Файлы не скачиваются: достаточно их идентификаторов в Telegram
+    new_attachments = [
+        attachment for attachment in map(attachment_from_message, album)
+        if attachment
+    ]
+
+    if new_attachments:
+        # Сохраняем информацию о файлах во временное хранилище
+        attachments = state_data.get('attachments', []) + new_attachments
+        await state.update_data(attachments=attachments)
+
+        await message.answer(describe_uploaded(new_attachments))
+
+        if not many_files:
+            await state.update_data(many_files=True)
+            await message.answer(
+                'Теперь можете загрузить ещё файлы или завершить процесс'
+                ', нажав соответствующую кнопку',
+                # noqa: E501
+                reply_markup=get_done_editing_files_keyboard(case_id),
+            )
     else:
         await message.answer(
             'Пожалуйста, прикрепите файл или завершите добавление, нажав кнопку ниже',
@@ -393,21 +470,21 @@ async def finish_editing_files(
         return
 
     try:
-        db.sql_query(
+        old_files = await get_case_files(case_id)
+        await async_db.sql_query(
             delete(File)
             .where(File.case_id == case_id),
             is_delete=True,
         )
 
-        for attachment_info in new_attachments:
-            file_name, file_path = attachment_info.split('@@@')
-            db.create_object(
-                File(
-                    file_name=file_name,
-                    file_url=file_path,
-                    case_id=case_id,
-                ),
-            )
+        await async_db.create_objects([
+            make_file(attachment, case_id)
+            for attachment in new_attachments
+        ])
+        invalidate_case_files(case_id)
+        await file_store.release(
+            file_row[0].file_unique_id for file_row in old_files
+        )
 
         await bot.delete_message(
             chat_id=query.message.chat.id,
@@ -434,11 +511,19 @@ async def start_delete_file(message: Message, command: CommandObject):
         await message.answer('Ошибка: не переданы аргументы')
         return
     file_name = command.args
-    db.sql_query(
+    file_unique_ids = await async_db.sql_query(
+        select(File.file_unique_id)
+        .where(File.file_name == file_name),
+        is_single=False,
+    )
+    await async_db.sql_query(
         delete(File)
         .where(File.file_name == file_name),
         is_delete=True,
     )
+    # Файл с таким именем мог быть у любого дела
+    invalidate_case_files()
+    await file_store.release(file_row[0] for file_row in file_unique_ids)
     await message.answer(f'Файл {file_name} был удалён')
 
 
@@ -449,7 +534,7 @@ async def handle_sending_case_files(
         bot: Bot,
 ):
     case_id = callback_data.case_id
-    files = get_case_files(case_id)
+    files = await get_case_files(case_id)
     if files:
         files_keyboard = create_files_keyboard(files)
         await bot.send_message(
@@ -471,13 +556,17 @@ async def handle_complete_case(
     case_id = callback_data.case_id
 
     # Получаем данные о случае из базы
-    case = get_case_by_id(case_id)
+    case = await get_case_by_id(case_id)
 
     # Обновляем статус
-    update_case(case_id, is_finished=True)
+    await update_case(case_id, is_finished=True, next_fire_at=None)
 
-    # Удаляем сообщение с напоминанием
-    await query.message.delete()
+    # Удаляем сообщение с напоминанием, а из сводки - только кнопки этого дела
+    remaining_keyboard = remove_case_buttons(getattr(query.message, 'reply_markup', None), case_id)
+    if remaining_keyboard is None:
+        await query.message.delete()
+    else:
+        await query.message.edit_reply_markup(reply_markup=remaining_keyboard)
 
     await query.answer(
         text=f'Событие "{case.name}" отмечено как выполненное',
@@ -510,7 +599,7 @@ async def process_new_date_selection(
 async def new_time_chosen(message: Message, state: FSMContext, bot: Bot):
     state_data = await state.get_data()
     case_id = state_data['case_id']
-    case = state_data.get('case')
+    case = await get_case_by_id(case_id)
     new_date_str = state_data.get('new_date')
     new_time_str = message.text.strip()
     name = escape_markdown(case.name)
@@ -519,22 +608,31 @@ async def new_time_chosen(message: Message, state: FSMContext, bot: Bot):
     await bot.delete_message(chat_id=message.chat.id, message_id=mes_id)
 
     try:
-        new_datetime = datetime.strptime(
+        local_datetime = datetime.strptime(
             f'{new_date_str} {new_time_str}', '%Y-%m-%d %H:%M',
         )
+        # Пользователь вводит местное время, в базе хранится UTC
+        new_datetime = to_utc(local_datetime, await get_user_tz(message.from_user.id))
 
         # Для повторяющихся событий обновляем только deadline_date
-        if case.repeat:
-            update_case(case_id, deadline_date=new_datetime)
+        if case.rrule:
+            await reschedule_case(
+                case_id,
+                new_datetime,
+                case.rrule,
+                deadline_date=new_datetime,
+            )
         else:
             # Для не повторяющихся обновляем оба поля
-            update_case(
+            await reschedule_case(
                 case_id,
+                new_datetime,
+                case.rrule,
                 deadline_date=new_datetime,
                 original_deadline=new_datetime
             )
 
-        date_str = escape_markdown(str(new_datetime))
+        date_str = escape_markdown(local_datetime.strftime(DISPLAY_FORMAT))
         await message.answer(
             text=f'Дата напоминания _{name}_ обновлена на {date_str}',
             parse_mode=ParseMode.MARKDOWN_V2,
@@ -565,16 +663,34 @@ async def process_new_repeat_selection(
     await bot.delete_message(chat_id=query.message.chat.id, message_id=mes_id)
     repeat_option = callback_data.repeat_option
     case_id = state_data['case_id']
-    case = state_data.get('case')
+    case = await get_case_by_id(case_id)
+
+    if repeat_option == REPEAT_EVERY_N_DAYS:
+        await bot.send_message(
+            chat_id=query.from_user.id,
+            text='Через сколько дней повторять напоминание?',
+        )
+        await state.set_state(EditCaseStates.waiting_for_repeat_interval)
+        return
 
-    if repeat_option == 'Нет':  # Если убираем повторение
-        update_case(
+    if repeat_option in ('Нет', REPEAT_NONE):  # Если убираем повторение
+        await reschedule_case(
             case_id,
+            case.original_deadline,
+            None,
             repeat=None,
+            rrule=None,
             deadline_date=case.original_deadline  # Возвращаем исходную дату
         )
     else:
-        update_case(case_id, repeat=repeat_option)
+        rule = rule_for_repeat(repeat_option)
+        await reschedule_case(
+            case_id,
+            case.deadline_date,
+            rule,
+            repeat=repeat_option,
+            rrule=rule,
+        )
 
     name = escape_markdown(case.name)
     await query.answer(
@@ -583,6 +699,31 @@ async def process_new_repeat_selection(
     await show_case_info(bot, query.from_user.id, case_id, state)
 
 
+@router.message(EditCaseStates.waiting_for_repeat_interval, F.text)
+async def process_new_repeat_interval(message: Message, state: FSMContext, bot: Bot):
+    interval = parse_interval(message.text)
+    if interval is None:
+        await message.answer(
+            f'Введите целое число дней от 1 до {MAX_INTERVAL_DAYS}',
+        )
+        return
+    state_data = await state.get_data()
+    case_id = state_data['case_id']
+    case = await get_case_by_id(case_id)
+    repeat, rule = every_n_days(interval)
+    await reschedule_case(
+        case_id,
+        case.deadline_date,
+        rule,
+        repeat=repeat,
+        rrule=rule,
+    )
+    await message.answer(
+        text=f'Периодичность напоминания "{case.name}" обновлена на {repeat}',
+    )
+    await show_case_info(bot, message.from_user.id, case_id, state)
+
+
 def is_valid_text(text):
     return isinstance(text, str) and text != ''
 
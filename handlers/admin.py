@@ -0,0 +1,46 @@
+import os
+
+from aiogram import Router
+from aiogram.filters.command import Command
+from aiogram.types import Message
+
+from handler_stats import handler_stats
+
+router = Router()
+
+TOP_HANDLERS = 10
+
+
+def is_admin(message: Message):
+    """Администраторы бота перечислены через запятую в ADMIN_IDS."""
+    admin_ids = os.getenv('ADMIN_IDS', '').replace(' ', '').split(',')
+    return str(message.from_user.id) in admin_ids
+
+
+def format_handler_line(name, totals):
+    count = totals.count
+    line = (
+        f'{name}: {count} обн., '
+        f'ср. {totals.total_time / count * 1000:.1f} мс, '
+        f'макс. {totals.max_time * 1000:.0f} мс, '
+        f'БД {totals.db_time / count * 1000:.1f} мс, '
+        f'API {totals.api_calls / count:.1f}'
+    )
+    if totals.slow:
+        line += f', медленных {totals.slow}'
+    return line
+
+
+# Самые затратные обработчики с момента запуска (см. handler_stats.py)
+@router.message(Command('admin_stats'), is_admin)
+async def admin_stats(message: Message):
+    top = handler_stats.top(TOP_HANDLERS)
+    if not top:
+        await message.answer(text='Статистики обработчиков пока нет')
+        return
+    await message.answer(
+        text='\n'.join([
+            f'Обработчики по суммарному времени (порог медленных {handler_stats.slow_ms:.0f} мс):',
+            *(format_handler_line(name, totals) for name, totals in top),
+        ]),
+    )
@@ -1,13 +1,20 @@
+import logging
+
 from aiogram import Bot, F, Router
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
-from aiogram.types import BufferedInputFile, CallbackQuery
-from sqlalchemy import delete, select
+from aiogram.types import CallbackQuery, FSInputFile
+from sqlalchemy import delete, select, update
 
-from database.db import db
+from database.cache import invalidate_case, invalidate_case_files
+from database.db import async_db
 from database.models import Cases, File
+from file_store import file_store
 from filters.callback_data import FileCallback, ManageCaseCallback
+from scheduler import reminder_queue
 
+logger = logging.getLogger(__name__)
 
 router = Router()
 
@@ -15,19 +22,40 @@ router = Router()
 @router.callback_query(FileCallback.filter())
 async def download_file(query: CallbackQuery, callback_data: FileCallback, bot: Bot):
     file_id = callback_data.file_id
-    user_file = db.sql_query(
+    user_file = await async_db.sql_query(
         select(File)
         .where(File.id == file_id),
         is_single=True,
     )
 
-    with open(user_file.file_url, 'rb') as f:
-        file_bytes = f.read()
+    # Файл уже есть на серверах Telegram - отправляем по file_id без чтения с диска
+    if user_file.telegram_file_id:
+        try:
+            await bot.send_document(
+                chat_id=query.from_user.id,
+                document=user_file.telegram_file_id,
+            )
+            return
+        except TelegramBadRequest as e:
+            logger.warning(f'Cached file_id of file {file_id} is invalid: {e}')
+
+    file_path = await file_store.ensure_local(bot, user_file)
+    if file_path is None:
+        await query.answer(text='Файл недоступен')
+        return
 
-    await bot.send_document(
+    # FSInputFile читает файл по частям во время отправки
+    sent_message = await bot.send_document(
         chat_id=query.from_user.id,
-        document=BufferedInputFile(file_bytes, filename=user_file.file_name),
+        document=FSInputFile(file_path, filename=user_file.file_name),
+    )
+    await async_db.sql_query(
+        update(File)
+        .where(File.id == file_id)
+        .values(telegram_file_id=sent_message.document.file_id),
+        is_update=True,
     )
+    invalidate_case_files(user_file.case_id)
 
 
 @router.callback_query(ManageCaseCallback.filter(F.action == 'delete'))
@@ -38,27 +66,36 @@ async def delete_case(
     state: FSMContext,
 ):
     state_data = await state.get_data()
-    name = state_data.get('case')
+    name = state_data.get('case_name')
     await bot.delete_message(
         chat_id=query.message.chat.id,
         message_id=query.message.message_id,
     )
     case_id = callback_data.case_id
+    file_unique_ids = await async_db.sql_query(
+        select(File.file_unique_id)
+        .where(File.case_id == case_id),
+        is_single=False,
+    )
     # Сначала удаляем все связанные файлы
-    db.sql_query(
+    await async_db.sql_query(
         delete(File)
         .where(File.case_id == case_id),
         is_delete=True,
     )
+    await file_store.release(file_row[0] for file_row in file_unique_ids)
     # Затем удаляем сам кейс
-    db.sql_query(
+    await async_db.sql_query(
         delete(Cases)
         .where(Cases.id == case_id),
         is_delete=True,
     )
+    invalidate_case(case_id)
+    invalidate_case_files(case_id)
+    reminder_queue.cancel(case_id)
     await bot.send_message(
         chat_id=query.from_user.id,
-        text=f'Событие _{name.name}_ удалено',
+        text=f'Событие _{name}_ удалено',
         parse_mode=ParseMode.MARKDOWN,
     )
     await state.clear()
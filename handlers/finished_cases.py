@@ -6,18 +6,23 @@ from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
-from sqlalchemy import select, update
 
 from attachments.keyboards import (
-    create_cases_keyboard,
     create_files_keyboard,
     create_finished_case_management_keyboard,
 )
-from database.db import db
-from database.models import Cases, File
-from filters.callback_data import FileCallback, CurrentCaseCallBack, ManageCaseCallback
+from filters.callback_data import (
+    CasesPageCallback,
+    CurrentCaseCallBack,
+    FileCallback,
+    ManageCaseCallback,
+)
 from filters.states import FinishedCasesStates
+from handlers.active_cases import get_case_by_id, get_case_files, reschedule_case
+from handlers.pagination import build_cases_page_keyboard
+from handlers.user import get_user_tz
 from utils.markdown_utils import escape_markdown
+from utils.timezones import DISPLAY_FORMAT, format_local, to_utc
 
 
 router = Router()
@@ -25,17 +30,11 @@ router = Router()
 
 @router.message(Command('finished_cases'))
 async def get_current_cases(message: Message, state: FSMContext, bot: Bot):
-    cases_data = db.sql_query(
-        select(Cases)
-        .where(
-            Cases.user_id == str(message.from_user.id),
-            Cases.is_finished == True,  # noqa: E712
-        )
-        .order_by(Cases.deadline_date),
-        is_single=False,
+    cases_keyboard = await build_cases_page_keyboard(
+        str(message.from_user.id),
+        is_finished=True,
     )
-    cases_keyboard = create_cases_keyboard(cases_data)
-    if not cases_data:
+    if not cases_keyboard:
         await bot.send_message(
             chat_id=message.from_user.id,
             text='У вас нет выполненных напоминаний',
@@ -49,6 +48,25 @@ async def get_current_cases(message: Message, state: FSMContext, bot: Bot):
     await state.set_state(FinishedCasesStates.get_current_cases)
 
 
+@router.callback_query(CasesPageCallback.filter(F.is_finished == True))  # noqa: E712
+async def turn_finished_cases_page(
+    query: CallbackQuery,
+    callback_data: CasesPageCallback,
+    state: FSMContext,
+):
+    cases_keyboard = await build_cases_page_keyboard(
+        str(query.from_user.id),
+        is_finished=True,
+        callback_data=callback_data,
+    )
+    if cases_keyboard is None:
+        await query.answer(text='Больше напоминаний нет')
+        return
+    await query.message.edit_reply_markup(reply_markup=cases_keyboard)
+    await query.answer()
+    await state.set_state(FinishedCasesStates.get_current_cases)
+
+
 @router.callback_query(
     FinishedCasesStates.get_current_cases,
     CurrentCaseCallBack.filter(),
@@ -60,14 +78,11 @@ async def download_file(
     state: FSMContext,
 ):
     case_id = callback_data.case_id
-    case = db.sql_query(
-        select(Cases)
-        .where(Cases.id == case_id),
-        is_single=True,
-    )
-    await state.update_data(case=case)
+    case = await get_case_by_id(case_id)
+    await state.update_data(case_name=case.name)
+    tz = await get_user_tz(case.user_id)
     reminders_msg = '\n'.join([
-        f'Дата: {case.deadline_date}',
+        f'Дата: {format_local(case.deadline_date, tz)}',
         f'Название: {case.name}',
         f'Описание: {case.description}',
         f'Повторение: {case.repeat}',
@@ -87,11 +102,7 @@ async def download_file(
 )
 async def show_files(query: CallbackQuery, callback_data: ManageCaseCallback, bot: Bot):
     case_id = callback_data.case_id
-    files = db.sql_query(
-        select(File)
-        .where(File.case_id == case_id),
-        is_single=False,
-    )
+    files = await get_case_files(case_id)
     if files:
         files_keyboard = create_files_keyboard(files)
         await bot.send_message(
@@ -147,23 +158,25 @@ async def process_time(message: Message, state: FSMContext, bot: Bot):
     state_data = await state.get_data()
     selected_date = state_data.get('selected_date')
     case_id = state_data.get('case_id')
-    name = escape_markdown(state_data.get('case').name)
+    case = await get_case_by_id(case_id)
+    name = escape_markdown(case.name)
     try:
         selected_time = datetime.strptime(time_str, '%H:%M').time()
         selected_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        full_datetime = datetime.combine(selected_date, selected_time)
-        await state.update_data(selected_date=full_datetime.strftime('%Y-%m-%d %H:%M'))
-        db.sql_query(
-            update(Cases)
-            .where(Cases.id == case_id)
-            .values(
-                is_finished=False,
-                deadline_date=full_datetime,
-                original_deadline=full_datetime,  # Обновляем оба поля
-            ),
-            is_update=True,
+        local_datetime = datetime.combine(selected_date, selected_time)
+        await state.update_data(selected_date=local_datetime.strftime('%Y-%m-%d %H:%M'))
+        # Пользователь вводит местное время, в базе хранится UTC
+        tz = await get_user_tz(message.from_user.id)
+        full_datetime = to_utc(local_datetime, tz)
+        await reschedule_case(
+            case_id,
+            full_datetime,
+            case.rrule,
+            is_finished=False,
+            deadline_date=full_datetime,
+            original_deadline=full_datetime,  # Обновляем оба поля
         )
-        date_str = escape_markdown(str(full_datetime))
+        date_str = escape_markdown(local_datetime.strftime(DISPLAY_FORMAT))
         await bot.send_message(
             chat_id=message.from_user.id,
             text=f'Событие _{name}_ восстановлено на дату {date_str}',
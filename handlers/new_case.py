@@ -1,4 +1,3 @@
-import os
 from datetime import datetime
 
 from aiogram import Bot, F, Router
@@ -10,16 +9,30 @@ from aiogram.types import Message, CallbackQuery
 
 from attachments import keyboards as kb
 from attachments import messages as msg
-from database.db import db
-from database.models import Cases, File
+from database.db import async_db
+from database.models import Cases
+from file_store import attachment_from_message, describe_uploaded, make_file
 from filters.callback_data import (
     NewCaseFinishWithFilesCallback,
     NewCaseInterfaceCallback,
     RepeatCallback,
 )
 from filters.states import NewCaseStates
+from handlers.user import get_user_tz
+from scheduler import reminder_queue
 
 from utils.markdown_utils import escape_markdown
+from utils.media_group import media_groups
+from utils.partitions import get_partition
+from utils.recurrence import (
+    MAX_INTERVAL_DAYS,
+    REPEAT_EVERY_N_DAYS,
+    every_n_days,
+    parse_interval,
+    rule_for_repeat,
+)
+from utils.schedule import compute_next_fire_at
+from utils.timezones import to_utc, utcnow
 
 
 router = Router()
@@ -130,7 +143,9 @@ async def process_time(message: Message, state: FSMContext, bot: Bot):
     try:
         selected_time = datetime.strptime(time_str, '%H:%M').time()
         selected_date = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
-        full_datetime = datetime.combine(selected_date, selected_time)
+        local_datetime = datetime.combine(selected_date, selected_time)
+        # Пользователь вводит местное время, в базе и состоянии хранится UTC
+        full_datetime = to_utc(local_datetime, await get_user_tz(message.from_user.id))
 
         await state.update_data(selected_date=full_datetime.strftime('%Y-%m-%d %H:%M'))
         await bot.send_message(
@@ -157,14 +172,77 @@ async def set_repeat(
         message_id=query.message.message_id,
     )
     repeat_option = callback_data.repeat_option
+    if repeat_option == REPEAT_EVERY_N_DAYS:
+        await bot.send_message(
+            chat_id=query.from_user.id,
+            text='Через сколько дней повторять напоминание?',
+        )
+        await state.set_state(NewCaseStates.set_repeat_interval)
+        return
+
+    await confirm_repeat(
+        bot,
+        query.from_user.id,
+        state,
+        repeat_option,
+        rule_for_repeat(repeat_option),
+    )
 
-    await state.update_data(repeat=repeat_option)
+
+# Периодичность "Каждые N дней": число дней вводится сообщением
+@router.message(NewCaseStates.set_repeat_interval, F.text)
+async def set_repeat_interval(message: Message, state: FSMContext, bot: Bot):
+    interval = parse_interval(message.text)
+    if interval is None:
+        await message.answer(
+            f'Введите целое число дней от 1 до {MAX_INTERVAL_DAYS}',
+        )
+        return
+    repeat, rule = every_n_days(interval)
+    await confirm_repeat(bot, message.from_user.id, state, repeat, rule)
+
+
+async def create_case(user_id, state_data):
+    """Сохраняет дело из данных диалога и ставит его напоминание в очередь.
+
+    Возвращает id дела.
+    """
+    # Дата в состоянии уже в UTC (см. process_time)
+    run_date = datetime.strptime(state_data['selected_date'], '%Y-%m-%d %H:%M')
+    # Диалоги, сохранённые до появления правил повторения, хранят только repeat
+    rule = state_data.get('rrule') or rule_for_repeat(state_data['repeat'])
+    now = utcnow()
+    tz = await get_user_tz(user_id)
+    next_fire_at = compute_next_fire_at(run_date, rule, now, tz)
+    partition = get_partition(user_id)
+
+    case = await async_db.create_object(
+        Cases(
+            user_id=user_id,
+            name=state_data['name'],
+            start_date=now,
+            last_notification=now,  # Добавляем
+            description=state_data['description'],
+            deadline_date=run_date,
+            original_deadline=run_date,  # Добавляем
+            repeat=state_data['repeat'],
+            rrule=rule,
+            next_fire_at=next_fire_at,
+            partition=partition,
+        ),
+    )
+    reminder_queue.reschedule(case, next_fire_at, partition)
+    return case
+
+
+async def confirm_repeat(bot, chat_id, state, repeat, rule):
+    await state.update_data(repeat=repeat, rrule=rule)
     await bot.send_message(
-        chat_id=query.from_user.id,
-        text=f'Выбранная Вами частота напоминания: {repeat_option}',
+        chat_id=chat_id,
+        text=f'Выбранная Вами частота напоминания: {repeat}',
     )
     await bot.send_message(
-        chat_id=query.from_user.id,
+        chat_id=chat_id,
         text=msg.NEW_CASE_FILES,
         reply_markup=await kb.yes_no_kb(),
     )
@@ -181,23 +259,8 @@ async def new_case(query: CallbackQuery, state: FSMContext, bot=Bot):
         chat_id=query.message.chat.id,
         message_id=query.message.message_id,
     )
-    user_id = query.from_user.id
     state_data = await state.get_data()
-    selected_date = state_data['selected_date']
-    run_date = datetime.strptime(selected_date, '%Y-%m-%d %H:%M')
-
-    db.create_object(
-        Cases(
-            user_id=user_id,
-            name=state_data['name'],
-            start_date=datetime.now(),
-            last_notification=datetime.now(),  # Добавляем
-            description=state_data['description'],
-            deadline_date=run_date,
-            original_deadline=run_date,  # Добавляем
-            repeat=state_data['repeat'],
-        ),
-    )
+    await create_case(query.from_user.id, state_data)
 
     await bot.send_message(
         chat_id=query.from_user.id,
@@ -228,34 +291,22 @@ async def case_files(query: CallbackQuery, state: FSMContext, bot=Bot):
 
 @router.message(NewCaseStates.set_files)
 async def set_files(message: Message, state: FSMContext, bot: Bot):
-    state_data = await state.get_data()
-
-    tmp_directory = 'tmp'
-    if not os.path.exists(tmp_directory):
-        os.makedirs(tmp_directory)
-
-    file_path = None
-    file_name = None
-
-    if message.document:
-        file_info = await message.bot.get_file(message.document.file_id)
-        file_path = os.path.join(tmp_directory, file_info.file_unique_id)
-        file_name = message.document.file_name
-
-    elif message.photo:
-        file_info = await message.bot.get_file(message.photo[-1].file_id)
-        file_name = f'photo_{file_info.file_unique_id}.jpg'
-        file_path = os.path.join(tmp_directory, file_name)
-
-    if file_path and file_name:
-        await message.bot.download_file(file_info.file_path, file_path)
-
-        attachments = state_data.get('attachments', [])
-        attachment_info = f'{file_name}@@@{file_path}'
-        attachments.append(attachment_info)
+    # Альбом целиком обрабатывает его первое сообщение
+    album = await media_groups.collect(message)
+    if album is None:
+        return
+    # Файлы не скачиваются: достаточно их идентификаторов в Telegram
+    new_attachments = [
+        attachment for attachment in map(attachment_from_message, album)
+        if attachment
+    ]
+
+    if new_attachments:
+        state_data = await state.get_data()
+        attachments = state_data.get('attachments', []) + new_attachments
         await state.update_data(attachments=attachments)
 
-        await message.answer(f'Файл {file_name} успешно загружен')
+        await message.answer(describe_uploaded(new_attachments))
 
     else:
         await message.answer(
@@ -274,32 +325,12 @@ async def finish_case_creation(query: CallbackQuery, state: FSMContext, bot=Bot)
         message_id=query.message.message_id,
     )
     state_data = await state.get_data()
-    user_id = query.from_user.id
-    selected_date = state_data['selected_date']
-    run_date = datetime.strptime(selected_date, '%Y-%m-%d %H:%M')
+    case = await create_case(query.from_user.id, state_data)
 
-    case = db.create_object(
-        Cases(
-            user_id=user_id,
-            name=state_data['name'],
-            start_date=datetime.now(),
-            last_notification=datetime.now(),  # Добавляем
-            description=state_data['description'],
-            deadline_date=run_date,
-            original_deadline=run_date,  # Добавляем
-            repeat=state_data['repeat'],
-        ),
-    )
-
-    for attachment_info in state_data['attachments']:
-        file_name, file_url = attachment_info.split('@@@')
-        db.create_object(
-            File(
-                file_name=file_name,
-                file_url=file_url,
-                case_id=case,
-            ),
-        )
+    await async_db.create_objects([
+        make_file(attachment, case)
+        for attachment in state_data['attachments']
+    ])
 
     await bot.send_message(
         chat_id=query.from_user.id,
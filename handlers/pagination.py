@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+
+from attachments.keyboards import create_cases_page_keyboard
+from database.db import async_db
+from database.models import Cases
+from filters.callback_data import CasesPageCallback
+from handlers.user import get_user_tz
+
+PAGE_SIZE = 10
+CURSOR_FORMAT = '%Y%m%d%H%M%S'
+
+
+def cases_page_query(user_id, is_finished, cursor=None, backwards=False):
+    """Запрос страницы дел пользователя (и одного дела сверх неё) после курсора.
+
+    Курсор - пара (deadline_date, id) граничного дела, поэтому каждая
+    страница читается диапазоном по индексу без OFFSET.
+    """
+    sort_key = tuple_(Cases.deadline_date, Cases.id)
+    query = (
+        select(Cases)
+        .where(
+            Cases.user_id == user_id,
+            Cases.is_finished == is_finished,
+        )
+        .limit(PAGE_SIZE + 1)
+    )
+    if backwards:
+        query = query.order_by(Cases.deadline_date.desc(), Cases.id.desc())
+        if cursor is not None:
+            query = query.where(sort_key < cursor)
+    else:
+        query = query.order_by(Cases.deadline_date, Cases.id)
+        if cursor is not None:
+            query = query.where(sort_key > cursor)
+    return query
+
+
+async def get_cases_page(user_id, is_finished, cursor=None, backwards=False):
+    """Возвращает страницу дел пользователя после (или до) курсора.
+
+    Вторым значением возвращается признак того, что в этом направлении
+    есть ещё дела.
+    """
+    query = cases_page_query(user_id, is_finished, cursor, backwards)
+    cases = await async_db.sql_query(query, is_single=False)
+    has_more = len(cases) > PAGE_SIZE
+    cases = cases[:PAGE_SIZE]
+    if backwards:
+        cases.reverse()
+    return cases, has_more
+
+
+def make_page_callback(case, is_finished, backwards):
+    return CasesPageCallback(
+        is_finished=is_finished,
+        backwards=backwards,
+        deadline=case.deadline_date.strftime(CURSOR_FORMAT),
+        case_id=case.id,
+    )
+
+
+def parse_page_callback(callback_data: CasesPageCallback):
+    deadline = datetime.strptime(callback_data.deadline, CURSOR_FORMAT)
+    return deadline, callback_data.case_id
+
+
+async def build_cases_page_keyboard(user_id, is_finished, callback_data=None):
+    """Клавиатура со страницей дел и кнопками перелистывания.
+
+    Без callback_data строится первая страница. Возвращает None, если дел нет.
+    """
+    cursor = None
+    backwards = False
+    if callback_data is not None:
+        cursor = parse_page_callback(callback_data)
+        backwards = callback_data.backwards
+
+    cases, has_more = await get_cases_page(user_id, is_finished, cursor, backwards)
+    if not cases:
+        return None
+
+    # Пришли со страницы по ту сторону курсора - значит, она существует
+    has_prev = has_more if backwards else cursor is not None
+    has_next = cursor is not None if backwards else has_more
+    prev_callback = None
+    next_callback = None
+    if has_prev:
+        prev_callback = make_page_callback(cases[0][0], is_finished, backwards=True)
+    if has_next:
+        next_callback = make_page_callback(cases[-1][0], is_finished, backwards=False)
+    tz = await get_user_tz(user_id)
+    return create_cases_page_keyboard(cases, prev_callback, next_callback, tz)
@@ -1,17 +1,38 @@
 from aiogram import Router
 from aiogram.filters import CommandStart
-from aiogram.filters.command import Command
+from aiogram.filters.command import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
-from sqlalchemy import select
+from sqlalchemy import bindparam, select, update
 
 from attachments.keyboards import main_kb
-from database.db import db
-from database.models import Users
+from database.cache import invalidate_case, invalidate_user_tz, user_tz_cache
+from database.db import async_db
+from database.models import Cases, Users
+from scheduler import reminder_queue
+from utils.partitions import get_partition
+from utils.schedule import compute_next_fire_at
+from utils.timezones import DEFAULT_TZ, format_local, is_valid_tz, utcnow
 
 
 router = Router()
 
+DIGEST_OPTIONS = {'on': True, 'off': False}
+
+
+async def get_user_tz(user_id):
+    """Часовой пояс пользователя (кэшируется, см. database/cache.py)."""
+    user_id = str(user_id)
+    tz = user_tz_cache.get(user_id)
+    if tz is None:
+        generation = user_tz_cache.generation(user_id)
+        tz = await async_db.sql_query(
+            select(Users.tz).where(Users.id == user_id),
+            is_single=True,
+        ) or DEFAULT_TZ
+        user_tz_cache.set(user_id, tz, generation)
+    return tz
+
 
 # Создание пользователя в бд
 @router.message(CommandStart())
@@ -20,7 +41,7 @@ async def start(message: Message):
     username = message.from_user.username
     first_name = message.from_user.first_name
     last_name = message.from_user.last_name
-    existing_user = db.sql_query(
+    existing_user = await async_db.sql_query(
         query=select(Users).where(Users.id == user_id),
         is_single=True,
     )
@@ -31,7 +52,7 @@ async def start(message: Message):
             reply_markup=main_kb,
         )
     else:
-        db.create_object(
+        await async_db.create_object(
             Users(
                 id=user_id,
                 username=username,
@@ -53,3 +74,101 @@ async def stop(message: Message, state: FSMContext):
         text='Продолжаем работу в Remandarine Bot!',
         reply_markup=main_kb,
     )
+
+
+# Часовой пояс пользователя: /timezone Europe/Berlin
+@router.message(Command('timezone'))
+async def set_timezone(message: Message, command: CommandObject):
+    user_id = str(message.from_user.id)
+    tz = (command.args or '').strip()
+    if not tz:
+        current_tz = await get_user_tz(user_id)
+        await message.answer(
+            text='\n'.join([
+                f'Ваш часовой пояс: {current_tz}',
+                f'Местное время: {format_local(utcnow(), current_tz)}',
+                'Чтобы изменить его, отправьте /timezone <пояс>, например /timezone Europe/Berlin',
+            ]),
+        )
+        return
+    if not is_valid_tz(tz):
+        await message.answer(
+            text=f'Неизвестный часовой пояс {tz}. Укажите его в формате Континент/Город',
+        )
+        return
+
+    existing_user = await async_db.sql_query(
+        select(Users.id).where(Users.id == user_id),
+        is_single=True,
+    )
+    if not existing_user:
+        await message.answer(text='Сначала запустите бота командой /start')
+        return
+
+    # Правила повторения применяются в местном времени, поэтому ближайшие
+    # срабатывания дел пересчитываются в новом поясе вместе с его сменой
+    now = utcnow()
+    cases = await async_db.sql_query(
+        select(Cases.id, Cases.deadline_date, Cases.rrule)
+        .where(
+            Cases.user_id == user_id,
+            Cases.is_finished == False,  # noqa: E712
+        ),
+        is_single=False,
+    )
+    rescheduled = [
+        {
+            'case_id': case_id,
+            'next_fire_at': compute_next_fire_at(deadline, rule, now, tz),
+        }
+        for case_id, deadline, rule in cases
+    ]
+    statements = [(update(Users.__table__).where(Users.id == user_id).values(tz=tz), None)]
+    if rescheduled:
+        statements.append((
+            update(Cases.__table__)
+            .where(Cases.id == bindparam('case_id'))
+            .values(next_fire_at=bindparam('next_fire_at')),
+            rescheduled,
+        ))
+    await async_db.execute_in_transaction(statements)
+    invalidate_user_tz(user_id)
+    partition = get_partition(user_id)
+    for case in rescheduled:
+        invalidate_case(case['case_id'])
+        reminder_queue.reschedule(case['case_id'], case['next_fire_at'], partition)
+    await message.answer(
+        text=f'Часовой пояс изменён на {tz}. Местное время: {format_local(utcnow(), tz)}',
+    )
+
+
+# Сводка напоминаний: /digest on или /digest off
+@router.message(Command('digest'))
+async def set_digest(message: Message, command: CommandObject):
+    user_id = str(message.from_user.id)
+    option = (command.args or '').strip().lower()
+    if option not in DIGEST_OPTIONS:
+        enabled = await async_db.sql_query(
+            select(Users.digest).where(Users.id == user_id),
+            is_single=True,
+        )
+        await message.answer(
+            text='\n'.join([
+                f'Сводка напоминаний {"включена" if enabled else "выключена"}.',
+                'В режиме сводки напоминания, сработавшие одновременно, приходят одним сообщением.',
+                'Включить: /digest on, выключить: /digest off',
+            ]),
+        )
+        return
+
+    enabled = DIGEST_OPTIONS[option]
+    updated = await async_db.sql_query(
+        update(Users).where(Users.id == user_id).values(digest=enabled),
+        is_update=True,
+    )
+    if not updated:
+        await message.answer(text='Сначала запустите бота командой /start')
+        return
+    await message.answer(
+        text='Сводка напоминаний включена' if enabled else 'Сводка напоминаний выключена',
+    )
@@ -0,0 +1,146 @@
+import logging
+import math
+import os
+import socket
+from datetime import timedelta
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import async_db
+from database.models import SchedulerLease, SchedulerWorker
+from utils.partitions import PARTITIONS_COUNT
+from utils.timezones import utcnow
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_SECONDS = 180  # Должно быть заметно больше интервала тика планировщика
+
+
+class LeaseManager:
+    """Аренда партиций напоминаний воркерами планировщика.
+
+    Дела разбиты на партиции по пользователю (utils/partitions.py), и каждую
+    партицию в любой момент обрабатывает только её арендатор. На каждом тике
+    воркер отмечается в scheduler_worker, продлевает свои аренды, отдаёт
+    лишние партиции сверх честной доли и забирает свободные или просроченные
+    (в том числе у упавших воркеров). Захват делается условным UPDATE, поэтому
+    две копии не могут получить одну партицию одновременно.
+    """
+
+    def __init__(self, worker_id=None, ttl_seconds=LEASE_TTL_SECONDS):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.partitions = frozenset()
+
+    async def _heartbeat(self, now):
+        await async_db.sql_query(
+            insert(SchedulerWorker)
+            .values(id=self.worker_id, heartbeat_at=now)
+            .on_conflict_do_update(
+                index_elements=[SchedulerWorker.id],
+                set_={'heartbeat_at': now},
+            ),
+            is_update=True,
+        )
+        return await async_db.sql_query(
+            select(func.count(SchedulerWorker.id))
+            .where(SchedulerWorker.heartbeat_at >= now - self.ttl),
+            is_single=True,
+        )
+
+    async def _owned_partitions(self, now):
+        await async_db.sql_query(
+            update(SchedulerLease)
+            .where(SchedulerLease.owner == self.worker_id)
+            .values(expires_at=now + self.ttl),
+            is_update=True,
+        )
+        rows = await async_db.sql_query(
+            select(SchedulerLease.partition)
+            .where(SchedulerLease.owner == self.worker_id),
+            is_single=False,
+        )
+        return {lease_row[0] for lease_row in rows}
+
+    async def _release(self, partitions):
+        await async_db.sql_query(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.partition.in_(partitions),
+                SchedulerLease.owner == self.worker_id,
+            )
+            .values(owner=None, expires_at=None),
+            is_update=True,
+        )
+
+    async def _claim(self, count, now):
+        claimed = set()
+        free_rows = await async_db.sql_query(
+            select(SchedulerLease.partition)
+            .where(or_(
+                SchedulerLease.owner.is_(None),
+                SchedulerLease.expires_at < now,
+            ))
+            .limit(count),
+            is_single=False,
+        )
+        for lease_row in free_rows:
+            partition = lease_row[0]
+            # Условие повторяется в UPDATE: партицию мог успеть занять другой воркер
+            updated = await async_db.sql_query(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.partition == partition,
+                    or_(
+                        SchedulerLease.owner.is_(None),
+                        SchedulerLease.expires_at < now,
+                    ),
+                )
+                .values(owner=self.worker_id, expires_at=now + self.ttl),
+                is_update=True,
+            )
+            if updated:
+                claimed.add(partition)
+        return claimed
+
+    async def sync(self):
+        """Продлевает и перераспределяет аренды, возвращает свои партиции."""
+        now = utcnow()
+        live_workers = max(await self._heartbeat(now), 1)
+        fair_share = math.ceil(PARTITIONS_COUNT / live_workers)
+
+        owned = await self._owned_partitions(now)
+        if len(owned) > fair_share:
+            extra = sorted(owned)[fair_share:]
+            await self._release(extra)
+            owned -= set(extra)
+        elif len(owned) < fair_share:
+            owned |= await self._claim(fair_share - len(owned), now)
+
+        if owned != self.partitions:
+            logger.info(f'Worker {self.worker_id} owns {len(owned)} partitions')
+        self.partitions = frozenset(owned)
+        return self.partitions
+
+    async def checkpoint(self, watermark):
+        """Сдвигает водяной знак своих партиций после успешного тика."""
+        await async_db.sql_query(
+            update(SchedulerLease)
+            .where(SchedulerLease.owner == self.worker_id)
+            .values(last_tick_at=watermark),
+            is_update=True,
+        )
+
+    async def release_all(self):
+        """Отдаёт все партиции и снимает отметку воркера (при остановке)."""
+        await self._release(list(self.partitions))
+        await async_db.sql_query(
+            delete(SchedulerWorker)
+            .where(SchedulerWorker.id == self.worker_id),
+            is_delete=True,
+        )
+        self.partitions = frozenset()
+
+
+lease_manager = LeaseManager()
@@ -0,0 +1,128 @@
+"""Метрики Prometheus бота и воркеров планировщика.
+
+Каждый процесс отдаёт свои метрики на /metrics отдельного aiohttp-сервера
+(METRICS_PORT), не на публичном адресе webhook.
+"""
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from utils.timezones import utcnow
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = '/metrics'
+# Интервал тика планировщика - 60 секунд, тики дольше него отстают
+TICK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LAG_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+TICK_DURATION = Histogram(
+    'scheduler_tick_duration_seconds',
+    'Duration of a scheduler tick',
+    buckets=TICK_BUCKETS,
+)
+REMINDER_LAG = Histogram(
+    'reminder_lag_seconds',
+    'Delay between the due time of a reminder and its delivery',
+    buckets=LAG_BUCKETS,
+)
+REMINDERS_SENT = Counter('reminders_sent_total', 'Reminders delivered to Telegram')
+REMINDERS_FAILED = Counter('reminders_failed_total', 'Reminders dropped after a Telegram error')
+REMINDERS_MISSED = Counter(
+    'reminders_missed_total',
+    'Reminders not sent on time: caught_up - sent late after downtime, '
+    'late - one-off reminder sent late after a timer delay, skipped - dropped repeat',
+    ['action'],
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'Duration of database calls by query kind',
+    ['kind'],
+    buckets=DB_BUCKETS,
+)
+TELEGRAM_REQUEST_DURATION = Histogram(
+    'telegram_api_request_duration_seconds',
+    'Duration of Telegram Bot API requests by method',
+    ['method'],
+)
+TELEGRAM_REQUEST_ERRORS = Counter(
+    'telegram_api_errors_total',
+    'Telegram Bot API requests that raised an error, by method',
+    ['method'],
+)
+CACHE_HITS = Counter('cache_hits_total', 'Lookups served from an in-process cache', ['cache'])
+CACHE_MISSES = Counter('cache_misses_total', 'Lookups missing in an in-process cache', ['cache'])
+CACHE_SIZE = Gauge('cache_size', 'Entries held by an in-process cache', ['cache'])
+
+
+def observe_reminder_sent(due_at):
+    """Учитывает доставленное напоминание со временем срабатывания due_at (UTC).
+
+    Таймер планировщика ставит напоминание в outbox в начале его секунды,
+    поэтому задержка - это доли секунды до срабатывания таймера плюс
+    ожидание в outbox и в лимитах Telegram. Пропущенные напоминания
+    передаются с due_at=None и в задержку не попадают. Раньше срока
+    напоминание уходит, только если тик работает без таймера (отдельные
+    скрипты и бенчмарки), - такая отправка считается без задержки.
+    """
+    REMINDERS_SENT.inc()
+    if due_at is not None:
+        REMINDER_LAG.observe(max((utcnow() - due_at).total_seconds(), 0))
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии Bot, замеряющий запросы к Bot API по методам."""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramAPIError:
+            TELEGRAM_REQUEST_ERRORS.labels(api_method).inc()
+            raise
+        finally:
+            TELEGRAM_REQUEST_DURATION.labels(api_method).observe(time.perf_counter() - started)
+
+
+async def handle_metrics(request):
+    return web.Response(
+        body=generate_latest(),
+        headers={'Content-Type': CONTENT_TYPE_LATEST},
+    )
+
+
+def create_metrics_app(path=METRICS_PATH):
+    app = web.Application()
+    app.router.add_get(path, handle_metrics)
+    return app
+
+
+class MetricsServer:
+    """aiohttp-сервер, отдающий метрики процесса на /metrics."""
+
+    def __init__(self, path=METRICS_PATH):
+        self.path = path
+        self._runner = None
+
+    async def start(self, host, port):
+        """Запускает сервер; пустой или нулевой port отключает метрики."""
+        if not port or not int(port):
+            return
+        self._runner = web.AppRunner(create_metrics_app(self.path))
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=host, port=int(port)).start()
+        logger.info(f'Metrics are served on {host}:{port}{self.path}')
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer()
@@ -0,0 +1,305 @@
+"""Надёжная доставка напоминаний через таблицу reminder_outbox.
+
+Тик планировщика не отправляет сообщения сам: он добавляет их в outbox в
+той же транзакции, что переносит или завершает дело. Отдельный цикл
+выбирает готовые сообщения своих партиций (см. leases.py) и передаёт их
+пулу доставки, а результаты пачками записывает обратно: отправленные
+отмечаются sent, временные ошибки повторяются с экспоненциальной
+задержкой, постоянные (пользователь заблокировал бота, чат не найден)
+и исчерпавшие попытки отмечаются failed. Ошибка одного сообщения не
+влияет на остальные.
+
+Напоминания пользователей в режиме сводки (Users.digest), готовые к
+отправке одновременно, уходят одним сообщением с общей клавиатурой.
+
+Доставка «хотя бы один раз»: если процесс упадёт между отправкой и
+записью результата, сообщение будет отправлено повторно.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from attachments.keyboards import create_digest_keyboard, create_sending_case_management_keyboard
+from database.db import async_db
+from database.models import ReminderOutbox
+from delivery import delivery_pool
+from leases import lease_manager
+from metrics import REMINDERS_FAILED, observe_reminder_sent
+from utils.timezones import utcnow
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+POLL_INTERVAL_SECONDS = 1
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+RETENTION_DAYS = 7
+# Ограничения сводки: длина сообщения Telegram и число дел на клавиатуре
+DIGEST_MAX_LENGTH = 4096
+DIGEST_MAX_CASES = 20
+# Повтор этих ошибок ничего не изменит
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound)
+
+
+def group_messages(messages):
+    """Разбивает сообщения на отправки: списки сообщений одного получателя.
+
+    Сообщения в режиме сводки объединяются по пользователю в пределах
+    ограничений сводки, остальные отправляются по одному.
+    """
+    batches = []
+    digests = {}
+    for message in messages:
+        if not message.digest:
+            batches.append([message])
+            continue
+        batch = digests.get(message.user_id)
+        length = sum(len(queued.text) + 8 for queued in batch or ()) + len(message.text)
+        if batch is None or len(batch) >= DIGEST_MAX_CASES or length > DIGEST_MAX_LENGTH - 64:
+            batch = []
+            digests[message.user_id] = batch
+            batches.append(batch)
+        batch.append(message)
+    return batches
+
+
+def message_kwargs(batch):
+    """Аргументы send_message для отправки одного или нескольких напоминаний."""
+    if len(batch) == 1:
+        return {
+            'chat_id': batch[0].user_id,
+            'text': batch[0].text,
+            'reply_markup': create_sending_case_management_keyboard(batch[0].case_id),
+        }
+    sections = [f'{number}. {message.text}' for number, message in enumerate(batch, start=1)]
+    return {
+        'chat_id': batch[0].user_id,
+        'text': '\n\n'.join([f'🔔 Напоминаний: {len(batch)}', *sections]),
+        'reply_markup': create_digest_keyboard([message.case_id for message in batch]),
+    }
+
+
+def retry_delay(attempts, retry_after=None):
+    """Задержка перед попыткой attempts + 1: 10 с, 20 с, 40 с... до часа."""
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return timedelta(seconds=max(delay, retry_after or 0))
+
+
+class OutboxRelay:
+    """Очередь напоминаний в базе и цикл её доставки."""
+
+    def __init__(self, poll_interval=POLL_INTERVAL_SECONDS, batch_size=BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._in_flight = set()
+        self._sent = []
+        self._retried = []
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def is_running(self):
+        return self._task is not None
+
+    @staticmethod
+    def entry(case, text, due_at, missed=False, digest=False):
+        """Значения строки outbox для срабатывания дела due_at."""
+        now = utcnow()
+        return {
+            'case_id': case.id,
+            'user_id': case.user_id,
+            'partition': case.partition,
+            'due_at': due_at,
+            'text': text,
+            'missed': missed,
+            'digest': digest,
+            'status': STATUS_PENDING,
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+        }
+
+    @staticmethod
+    def enqueue_statement(entries):
+        """Пара (запрос, параметры) для execute_in_transaction.
+
+        Срабатывание, уже ожидающее отправки, повторно не добавляется.
+        """
+        return insert(ReminderOutbox.__table__).on_conflict_do_nothing(), entries
+
+    def start(self, bot):
+        """Запускает пул доставки и цикл выборки сообщений."""
+        delivery_pool.start(bot, on_result=self.record_result)
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        """Останавливает выборку, дожидается пула и записывает результаты."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await delivery_pool.stop()
+        await self.flush()
+
+    def wake(self):
+        """Запускает выборку сразу, не дожидаясь интервала опроса."""
+        self._wakeup.set()
+
+    async def _run(self, bot):
+        while True:
+            try:
+                await self.drain(bot, lease_manager.partitions)
+            except Exception:
+                logger.exception('Outbox drain failed')
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def ready_query(self, partitions):
+        """Запрос сообщений, ожидающих отправки; partitions=None - всех партиций."""
+        query = (
+            select(
+                ReminderOutbox.id,
+                ReminderOutbox.case_id,
+                ReminderOutbox.user_id,
+                ReminderOutbox.due_at,
+                ReminderOutbox.text,
+                ReminderOutbox.missed,
+                ReminderOutbox.digest,
+                ReminderOutbox.attempts,
+            )
+            .where(
+                ReminderOutbox.status == STATUS_PENDING,
+                ReminderOutbox.next_attempt_at <= utcnow(),
+            )
+            .order_by(ReminderOutbox.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        if partitions is not None:
+            query = query.where(ReminderOutbox.partition.in_(sorted(partitions)))
+        return query
+
+    async def fetch_ready(self, partitions):
+        """Сообщения, ожидающие отправки; partitions=None - всех партиций."""
+        if partitions is not None and not partitions:
+            return []
+        return await async_db.sql_query(self.ready_query(partitions), is_single=False)
+
+    async def drain(self, bot, partitions=None):
+        """Отправляет готовые сообщения и записывает результаты.
+
+        Если пул доставки запущен, сообщения ставятся в его очередь, а
+        результаты записываются следующим вызовом; иначе они отправляются
+        здесь же по одному. Возвращает число взятых в работу напоминаний.
+        """
+        ready = [
+            message for message in await self.fetch_ready(partitions)
+            if message.id not in self._in_flight
+        ]
+        for batch in group_messages(ready):
+            self._in_flight.update(message.id for message in batch)
+            kwargs = message_kwargs(batch)
+            if delivery_pool.is_running:
+                await delivery_pool.send_message(tag=batch, **kwargs)
+                continue
+            try:
+                await bot.send_message(**kwargs)
+            except Exception as e:
+                self.record_result(batch, e)
+            else:
+                self.record_result(batch, None)
+        await self.flush()
+        return len(ready)
+
+    def record_result(self, batch, error):
+        """Запоминает результат отправки до следующей записи в базу."""
+        for message in batch:
+            self._record_message_result(message, error)
+
+    def _record_message_result(self, message, error):
+        now = utcnow()
+        attempts = message.attempts + 1
+        if error is None:
+            observe_reminder_sent(None if message.missed else message.due_at)
+            self._sent.append({'outbox_id': message.id, 'sent_at': now, 'attempts': attempts})
+            return
+
+        result = {
+            'outbox_id': message.id,
+            'status': STATUS_PENDING,
+            'attempts': attempts,
+            'next_attempt_at': now,
+            'last_error': f'{type(error).__name__}: {error}'[:500],
+        }
+        if isinstance(error, PERMANENT_ERRORS) or attempts >= MAX_ATTEMPTS:
+            logger.error(f'Reminder {message.id} to chat {message.user_id} failed: {error}')
+            REMINDERS_FAILED.inc()
+            result['status'] = STATUS_FAILED
+        else:
+            logger.warning(f'Reminder {message.id} to chat {message.user_id} will be retried: {error}')
+            result['next_attempt_at'] = now + retry_delay(attempts, getattr(error, 'retry_after', None))
+        self._retried.append(result)
+
+    async def flush(self):
+        """Записывает накопленные результаты одной транзакцией."""
+        sent, retried = self._sent, self._retried
+        if not sent and not retried:
+            return
+        self._sent, self._retried = [], []
+        statements = []
+        if sent:
+            statements.append((
+                update(ReminderOutbox.__table__)
+                .where(ReminderOutbox.id == bindparam('outbox_id'))
+                .values(
+                    status=STATUS_SENT,
+                    sent_at=bindparam('sent_at'),
+                    attempts=bindparam('attempts'),
+                ),
+                sent,
+            ))
+        if retried:
+            statements.append((
+                update(ReminderOutbox.__table__)
+                .where(ReminderOutbox.id == bindparam('outbox_id'))
+                .values(
+                    status=bindparam('status'),
+                    attempts=bindparam('attempts'),
+                    next_attempt_at=bindparam('next_attempt_at'),
+                    last_error=bindparam('last_error'),
+                ),
+                retried,
+            ))
+        try:
+            await async_db.execute_in_transaction(statements)
+        finally:
+            # При ошибке записи сообщения останутся pending и уйдут повторно
+            for result in (*sent, *retried):
+                self._in_flight.discard(result['outbox_id'])
+
+    async def purge(self, retention_days=RETENTION_DAYS):
+        """Удаляет отправленные и окончательно неотправленные сообщения."""
+        deleted = await async_db.sql_query(
+            delete(ReminderOutbox)
+            .where(
+                ReminderOutbox.status.in_((STATUS_SENT, STATUS_FAILED)),
+                ReminderOutbox.created_at < utcnow() - timedelta(days=retention_days),
+            ),
+            is_delete=True,
+        )
+        if deleted:
+            logger.info(f'Purged {deleted} delivered reminders from the outbox')
+
+
+outbox_relay = OutboxRelay()
@@ -1,114 +1,439 @@
+import asyncio
 import logging
-from datetime import datetime
+import time
+from datetime import timedelta
 
 from aiogram import Router
 from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select, update
+from sqlalchemy import bindparam, select, update
 
-from attachments.keyboards import create_sending_case_management_keyboard
-from database.db import db
-from database.models import Cases
+from database.cache import invalidate_case
+from database.db import async_db
+from database.models import Cases, SchedulerLease, Users
+from leases import lease_manager
+from metrics import REMINDERS_MISSED, TICK_DURATION
+from outbox import outbox_relay
+from utils.schedule import compute_next_fire_at
+from utils.timezones import format_local, from_epoch_second, to_epoch_second, utcnow
+from utils.timing_wheel import TimingWheel
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
 # Константы
 TIME_THRESHOLD_SECONDS = 30  # Пороговое значение в секундах
+CHECK_INTERVAL_SECONDS = 60  # Интервал между тиками (аренды, перечитывание окна)
+# Таймер просыпается чуть позже границы секунды, чтобы utcnow() уже был на ней
+TIMER_DELAY_SECONDS = 0.005
 
 scheduler = AsyncIOScheduler(executors={'default': AsyncIOExecutor()})
 router = Router()
 
 
-def get_unfinished_cases():
-    """Получение незавершенных дел из базы данных."""
-    return db.sql_query(
-        query=select(Cases)
-        .where(Cases.is_finished.is_(False)),
+class ReminderQueue:
+    """Ближайшие срабатывания напоминаний в колесе таймеров.
+
+    Колесо (utils/timing_wheel.py) хранит одно срабатывание на дело и
+    выдаёт наступившие с точностью до секунды. После смены партиций оно
+    загружается из базы целиком, а обработчики этого процесса сообщают о
+    создании, изменении, завершении и удалении дел через reschedule/cancel.
+    Дела могут менять и другие процессы (бот с RUN_SCHEDULER=0, воркер, не
+    владеющий партицией), поэтому на каждом тике окно по индексу
+    next_fire_at перечитывается начиная с момента предыдущего чтения:
+    дело, записанное между тиками, загрузится, даже если его срабатывание
+    уже прошло. Колесо - только подсказка: перед отправкой дело
+    проверяется по базе, устаревшие срабатывания отбрасываются.
+
+    Если задан набор партиций (см. leases.py), очередь обслуживает только
+    дела этих партиций. Набор задаёт тик планировщика; пока его нет
+    (RUN_SCHEDULER=0, колесо в процессе никто не продвигает), сообщения
+    обработчиков игнорируются, как и сообщения о делах чужих партиций:
+    их воркеры увидят изменения по next_fire_at в базе.
+    """
+
+    def __init__(self, lookahead_seconds=2 * CHECK_INTERVAL_SECONDS):
+        # С запасом на задержку следующего тика
+        self.lookahead = timedelta(seconds=lookahead_seconds)
+        self.partitions = None
+        self._wheel = TimingWheel(to_epoch_second(utcnow()))
+        self._loaded = False
+        self._read_at = None
+
+    def __len__(self):
+        return len(self._wheel)
+
+    @property
+    def fired_until(self):
+        """Время, до которого включительно наступившие срабатывания выданы."""
+        return from_epoch_second(self._wheel.now)
+
+    def set_partitions(self, partitions):
+        """Меняет набор обслуживаемых партиций и при изменении сбрасывает колесо.
+
+        Следующее пополнение загрузит дела партиций целиком, так что
+        просроченные дела перешедших партиций тоже будут обработаны.
+        """
+        partitions = frozenset(partitions)
+        if partitions == self.partitions:
+            return
+        self.partitions = partitions
+        self._wheel.clear(to_epoch_second(utcnow()))
+        self._loaded = False
+
+    def owns(self, case):
+        return self.partitions is None or case.partition in self.partitions
+
+    @property
+    def is_active(self):
+        """Работает ли планировщик в этом процессе."""
+        return self.partitions is not None
+
+    def reschedule(self, case_id, fire_at, partition):
+        """Сообщает очереди о новом времени срабатывания дела (None - отмена).
+
+        partition - партиция дела: дела партиций, арендованных другими
+        воркерами, в колесо не попадают.
+        """
+        if fire_at is None:
+            self.cancel(case_id)
+            return
+        if not self.is_active or partition not in self.partitions:
+            return
+        self._wheel.schedule(int(case_id), to_epoch_second(fire_at))
+
+    def cancel(self, case_id):
+        """Убирает срабатывание завершённого или удалённого дела."""
+        if self.is_active:
+            self._wheel.cancel(int(case_id))
+
+    async def refill(self, until):
+        """Загружает в колесо дела со временем срабатывания до until.
+
+        Первое пополнение после смены партиций читает все незавершённые дела,
+        следующие - только окно от начала предыдущего чтения (с допуском
+        TIME_THRESHOLD_SECONDS на расхождение часов процессов) до until.
+        Дела, загруженные уже просроченными, колесо выдаст на ближайшем
+        срабатывании таймера.
+        """
+        if self.partitions is not None and not self.partitions:
+            self._loaded = True
+            self._read_at = utcnow()
+            return
+        loaded = self._loaded
+        if loaded:
+            # Граница - предыдущее чтение, а не выданные секунды: дело,
+            # записанное другим процессом после него, могло сработать раньше
+            since = min(self._read_at, self.fired_until) - timedelta(seconds=TIME_THRESHOLD_SECONDS)
+            query = self.window_query(since, until)
+        else:
+            query = self.window_query()
+        wheel = self._wheel
+        read_at = utcnow()
+        for case_id, fire_at in await async_db.sql_query(query, is_single=False):
+            second = to_epoch_second(fire_at)
+            # Прошедшее время в окне - чаще всего дело, выданное колесом, пока
+            # шёл запрос; его новое срабатывание уже в колесе
+            if not loaded or second > wheel.now or case_id not in wheel:
+                wheel.schedule(case_id, second)
+        self._loaded = True
+        self._read_at = read_at
+
+    def window_query(self, since=None, until=None):
+        """Запрос незавершённых дел своих партиций со срабатыванием в [since, until).
+
+        Без границ - все дела, у которых есть время срабатывания.
+        """
+        query = select(Cases.id, Cases.next_fire_at).where(Cases.is_finished.is_(False))
+        if self.partitions is not None:
+            query = query.where(Cases.partition.in_(sorted(self.partitions)))
+        if since is None:
+            return query.where(Cases.next_fire_at.is_not(None))
+        return query.where(Cases.next_fire_at >= since, Cases.next_fire_at < until)
+
+    def pop_due(self, until):
+        """Извлекает из колеса все дела со временем срабатывания до until.
+
+        Возвращает словарь {идентификатор дела: секунда срабатывания}.
+        """
+        # Срабатывание наступило, если его секунда прошла целиком
+        return self._wheel.advance(to_epoch_second(until.replace(microsecond=0)))
+
+
+reminder_queue = ReminderQueue()
+
+
+async def get_cases_by_ids(case_ids):
+    """Дела по списку идентификаторов: строки (дело, часовой пояс, режим сводки)."""
+    return await async_db.sql_query(
+        query=select(Cases, Users.tz, Users.digest)
+        .outerjoin(Users, Users.id == Cases.user_id)
+        .where(Cases.id.in_(case_ids)),
         is_single=False,
     )
 
 
-def update_case_status(case_id, **fields):
-    """Обновление статуса дела."""
-    db.sql_query(
-        update(Cases)
-        .where(Cases.id == case_id)
-        .values(**fields),
-        is_update=True,
-    )
+class TickOutcomes:
+    """Итоги тика, которые записываются в базу одной транзакцией.
+
+    Напоминания попадают в outbox (см. outbox.py) вместе с изменением дел.
+    Напоминания пользователей из digest_users объединяются при доставке.
+    """
 
+    def __init__(self, digest_users=()):
+        self.digest_users = frozenset(digest_users)
+        self.finished_ids = []
+        self.advanced = []
+        self.partitions = {}
+        self.reminders = []
 
-def should_process_repeating_case(case, now):
-    """Проверяет, нужно ли обрабатывать повторяющееся дело."""
-    deadline = case.deadline_date
-    deadline_time = deadline.time()
-    current_time = now.time()
+    def __len__(self):
+        return len(self.finished_ids) + len(self.advanced)
 
-    # Если время не совпадает, не обрабатываем
-    if deadline_time.hour != current_time.hour:
-        return False
-    if deadline_time.minute != current_time.minute:
-        return False
+    def remind(self, case, tz, fire_at, missed=False):
+        """Ставит напоминание о срабатывании fire_at в очередь на отправку."""
+        self.reminders.append(outbox_relay.entry(
+            case,
+            format_reminder(case, tz, missed),
+            fire_at,
+            missed=missed,
+            digest=case.user_id in self.digest_users,
+        ))
 
-    # Для ежемесячных - проверяем день месяца
-    if case.repeat == 'Ежемесячно' and deadline.day != now.day:
-        return False
+    def finish(self, case):
+        """Неповторяющееся дело напомнено и должно быть завершено."""
+        self.finished_ids.append(case.id)
 
-    # Для еженедельных - проверяем день недели
-    if case.repeat == 'Еженедельно' and deadline.weekday() != now.weekday():
-        return False
+    def advance(self, case, tz, fire_at, last_notification=None):
+        """Повторяющееся дело переносится на следующее срабатывание."""
+        next_fire_at = compute_next_fire_at(
+            case.deadline_date,
+            case.rrule,
+            fire_at + timedelta(seconds=1),
+            tz,
+        )
+        self.advanced.append({
+            'case_id': case.id,
+            'next_fire_at': next_fire_at,
+            'last_notification': last_notification or case.last_notification,
+        })
+        self.partitions[case.id] = case.partition
 
-    return True
+    async def flush(self):
+        """Записывает накопленные изменения и обновляет очередь."""
+        statements = []
+        if self.reminders:
+            statements.append(outbox_relay.enqueue_statement(self.reminders))
+        if self.finished_ids:
+            statements.append((
+                update(Cases.__table__)
+                .where(Cases.id.in_(self.finished_ids))
+                .values(is_finished=True, next_fire_at=None),
+                None,
+            ))
+        if self.advanced:
+            statements.append((
+                update(Cases.__table__)
+                .where(Cases.id == bindparam('case_id'))
+                .values(
+                    next_fire_at=bindparam('next_fire_at'),
+                    last_notification=bindparam('last_notification'),
+                ),
+                self.advanced,
+            ))
+        if statements:
+            await async_db.execute_in_transaction(statements)
+        if self.reminders:
+            # Напоминания уходят сразу, а не при следующем опросе outbox
+            outbox_relay.wake()
+        for case_id in self.finished_ids:
+            invalidate_case(case_id)
+        for advanced in self.advanced:
+            invalidate_case(advanced['case_id'])
+        for advanced in self.advanced:
+            reminder_queue.reschedule(
+                advanced['case_id'],
+                advanced['next_fire_at'],
+                self.partitions[advanced['case_id']],
+            )
 
 
-async def process_nonrepeating_case(bot, case, now):
-    """Обработка неповторяющегося дела."""
-    deadline = case.deadline_date
-    time_diff = (now - deadline).total_seconds()
+def process_nonrepeating_case(case, tz, fire_at, now, outcomes):
+    """Обработка неповторяющегося дела.
 
-    if abs(time_diff) <= TIME_THRESHOLD_SECONDS:
-        await send_reminder(bot, case)
-        update_case_status(case.id, is_finished=True)
+    Срабатывание, выданное колесом позже TIME_THRESHOLD_SECONDS (задержка
+    таймера, ошибка записи тика, дело загружено уже просроченным), уходит
+    как пропущенное напоминание: иначе дело осталось бы активным навсегда.
+    """
+    missed = (now - fire_at).total_seconds() > TIME_THRESHOLD_SECONDS
+    if missed:
+        REMINDERS_MISSED.labels('late').inc()
+    outcomes.remind(case, tz, fire_at, missed=missed)
+    outcomes.finish(case)
 
 
-async def process_repeating_case(bot, case, now):
+def process_repeating_case(case, tz, fire_at, now, outcomes):
     """Обработка повторяющегося дела."""
-    if should_process_repeating_case(case, now):
-        await send_reminder(bot, case)
-        update_case_status(case.id, last_notification=now)
+    if abs((now - fire_at).total_seconds()) <= TIME_THRESHOLD_SECONDS:
+        outcomes.remind(case, tz, fire_at)
+        outcomes.advance(case, tz, fire_at, last_notification=now)
+    else:
+        # Срабатывание пропущено - просто переходим к следующему
+        REMINDERS_MISSED.labels('skipped').inc()
+        outcomes.advance(case, tz, fire_at)
+
+
+async def check_and_send_reminders(until=None):
+    """Ставит в outbox напоминания, сработавшие к until (по умолчанию - сейчас)."""
+    # Время в базе и в очереди - UTC (см. utils/timezones.py)
+    now = utcnow()
+    due = reminder_queue.pop_due(until or now)
+    if not due:
+        return
+
+    rows = await get_cases_by_ids(list(due))
+    outcomes = TickOutcomes(digest_users=(case.user_id for case, _, digest in rows if digest))
+    try:
+        for case, tz, _ in rows:
+            fire_at = case.next_fire_at
+            # Дело изменилось после попадания в очередь или ушло другому воркеру
+            if (
+                case.is_finished
+                or fire_at is None
+                or to_epoch_second(fire_at) != due[case.id]
+                or not reminder_queue.owns(case)
+            ):
+                continue
+            logger.info(f'Processing case {case.id} (rrule: {case.rrule})')
+
+            if case.rrule:
+                process_repeating_case(case, tz, fire_at, now, outcomes)
+            else:
+                process_nonrepeating_case(case, tz, fire_at, now, outcomes)
+    finally:
+        # Обработанные дела фиксируются даже при ошибке посреди тика
+        await outcomes.flush()
+    logger.info(f'Processed {len(outcomes)} due reminders')
+
+
+class ReminderTimer:
+    """Срабатывает в начале каждой секунды и ставит в outbox наступившие напоминания.
+
+    Секунды отсчитываются по часам, а не от предыдущего срабатывания, поэтому
+    долгая обработка не накапливает сдвиг: пропущенные секунды колесо
+    выдаёт при следующем срабатывании.
+    """
+
+    def __init__(self):
+        self._task = None
+
+    @property
+    def is_running(self):
+        return self._task is not None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
 
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
 
-async def check_and_send_reminders(bot):
-    """Основная функция проверки и отправки напоминаний."""
-    now = datetime.now()
-    logger.info(f'Checking reminders at {now}')
+    async def _run(self):
+        while True:
+            await asyncio.sleep(1 - time.time() % 1 + TIMER_DELAY_SECONDS)
+            try:
+                await check_and_send_reminders()
+            except Exception:
+                logger.exception('Reminder timer failed')
 
-    cases = get_unfinished_cases()
 
-    for case_data in cases:
-        case = case_data[0]
-        logger.info(f'Processing case {case.id} (repeat: {case.repeat})')
+reminder_timer = ReminderTimer()
 
-        if case.repeat:
-            await process_repeating_case(bot, case, now)
+
+def missed_cases_query(partitions, cutoff):
+    """Запрос дел партиций со срабатыванием от их водяного знака до cutoff."""
+    return (
+        select(Cases, Users.tz, Users.digest)
+        .join(SchedulerLease, SchedulerLease.partition == Cases.partition)
+        .outerjoin(Users, Users.id == Cases.user_id)
+        .where(
+            Cases.is_finished.is_(False),
+            Cases.partition.in_(sorted(partitions)),
+            Cases.next_fire_at >= SchedulerLease.last_tick_at,
+            Cases.next_fire_at < cutoff,
+        )
+    )
+
+
+async def catch_up_missed_reminders(partitions):
+    """Ставит в outbox напоминания, пропущенные, пока партиции никто не обслуживал.
+
+    Пропущенными считаются незавершённые дела со временем срабатывания между
+    водяным знаком партиции (last_tick_at) и началом окна текущего тика.
+    Они читаются одним диапазонным запросом по индексу и уходят через outbox
+    с ограничением скорости пула доставки. Возвращает число напоминаний.
+    """
+    now = utcnow()
+    cutoff = now - timedelta(seconds=TIME_THRESHOLD_SECONDS)
+    missed = await async_db.sql_query(missed_cases_query(partitions, cutoff), is_single=False)
+    if not missed:
+        return 0
+
+    REMINDERS_MISSED.labels('caught_up').inc(len(missed))
+    outcomes = TickOutcomes(digest_users=(case.user_id for case, _, digest in missed if digest))
+    try:
+        for case, tz, _ in missed:
+            outcomes.remind(case, tz, case.next_fire_at, missed=True)
+            if case.rrule:
+                # Одно напоминание вместо всех пропущенных повторов
+                outcomes.advance(case, tz, cutoff, last_notification=now)
+            else:
+                outcomes.finish(case)
+    finally:
+        await outcomes.flush()
+    logger.info(f'Caught up {len(outcomes)} missed reminders in {len(partitions)} partitions')
+    return len(outcomes)
+
+
+async def scheduler_tick(bot):
+    """Тик шардированного планировщика.
+
+    Продлевает аренды, догоняет пропущенные напоминания в полученных
+    партициях (в том числе после перезапуска), пополняет колесо и сдвигает
+    водяной знак своих партиций. Точно в срок напоминания ставит в outbox
+    таймер (reminder_timer); если он не запущен (отдельные скрипты и
+    бенчмарки), тик, как раньше, обрабатывает окно ±TIME_THRESHOLD_SECONDS.
+    Если не запущен цикл доставки outbox, сообщения отправляются здесь же.
+    """
+    with TICK_DURATION.time():
+        previous = reminder_queue.partitions or frozenset()
+        partitions = await lease_manager.sync()
+        acquired = partitions - previous
+        if acquired:
+            await catch_up_missed_reminders(acquired)
+        reminder_queue.set_partitions(partitions)
+        now = utcnow()
+        await reminder_queue.refill(now + reminder_queue.lookahead)
+        if reminder_timer.is_running:
+            await check_and_send_reminders()
         else:
-            await process_nonrepeating_case(bot, case, now)
+            await check_and_send_reminders(now + timedelta(seconds=TIME_THRESHOLD_SECONDS))
+        await lease_manager.checkpoint(reminder_queue.fired_until)
+    if not outbox_relay.is_running:
+        await outbox_relay.drain(bot, partitions)
 
 
-async def send_reminder(bot, case):
-    """Отправка напоминания пользователю."""
-    management_keyboard = create_sending_case_management_keyboard(case.id)
-    formatted_date = case.deadline_date.strftime('%Y-%m-%d %H:%M')
+def format_reminder(case, tz=None, missed=False):
+    """Текст напоминания (время - в часовом поясе пользователя tz)."""
+    formatted_date = format_local(case.deadline_date, tz)
     reminder_msg = '\n'.join([
         f'📅 {formatted_date}',
         f'🔹 {case.name}',
         f'📝 {case.description}',
         f'🔄 Повтор: {case.repeat}',
     ])
-
-    await bot.send_message(
-        chat_id=case.user_id,
-        text=reminder_msg,
-        reply_markup=management_keyboard,
-    )
+    if missed:
+        reminder_msg += '\n⏰ Напоминание пропущено, пока бот был недоступен'
+    return reminder_msg
@@ -0,0 +1,62 @@
+"""Отдельный процесс рассылки напоминаний.
+
+Несколько таких процессов (и сам бот, если RUN_SCHEDULER=1) делят между собой
+партиции дел через таблицу аренды scheduler_lease (см. leases.py).
+
+Запуск: python scheduler_worker.py
+"""
+import asyncio
+import logging
+import os
+
+from aiogram import Bot
+from dotenv import load_dotenv
+
+# До модулей проекта: database.db и handler_stats читают настройки при импорте
+load_dotenv()
+
+from database.db import db  # noqa: E402
+from database.migrations import upgrade  # noqa: E402
+from leases import lease_manager  # noqa: E402
+from metrics import TelegramMetricsMiddleware, metrics_server  # noqa: E402
+from outbox import outbox_relay  # noqa: E402
+from scheduler import CHECK_INTERVAL_SECONDS, reminder_timer, scheduler_tick  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(bot, interval=CHECK_INTERVAL_SECONDS):
+    """Выполняет тики планировщика до отмены задачи."""
+    outbox_relay.start(bot)
+    reminder_timer.start()
+    try:
+        while True:
+            try:
+                await scheduler_tick(bot)
+            except Exception:
+                logger.exception('Scheduler tick failed')
+            await asyncio.sleep(interval)
+    finally:
+        await reminder_timer.stop()
+        await outbox_relay.stop()
+        await lease_manager.release_all()
+
+
+async def main():
+    upgrade(db.engine)
+    bot = Bot(token=os.getenv('BOT_TOKEN'))
+    bot.session.middleware(TelegramMetricsMiddleware())
+    await metrics_server.start(
+        host=os.getenv('METRICS_HOST', '0.0.0.0'),
+        port=os.getenv('METRICS_PORT', '9100'),
+    )
+    try:
+        await run_worker(bot)
+    finally:
+        await metrics_server.stop()
+        await bot.session.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
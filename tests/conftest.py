@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+
+# database.db подключается к DATABASE_URL при импорте, поэтому база тестов
+# задаётся до импорта модулей бота
+os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/database.db'
+
+from database.db import db  # noqa: E402
+from database.migrations import upgrade  # noqa: E402
+from database.models import Base  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """База бота с актуальной схемой; после теста таблицы очищаются."""
+    upgrade(db.engine)
+    yield db
+    with db.engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
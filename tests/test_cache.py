@@ -0,0 +1,33 @@
+from utils.cache import TTLCache
+
+
+def test_value_read_before_invalidate_is_not_cached():
+    cache = TTLCache()
+    generation = cache.generation(1)
+    # Дело изменилось, пока шло чтение старой строки
+    cache.invalidate(1)
+    cache.set(1, 'stale', generation)
+    assert cache.get(1) is None
+
+    cache.set(1, 'fresh', cache.generation(1))
+    assert cache.get(1) == 'fresh'
+
+
+def test_invalidating_other_keys_does_not_block_set():
+    cache = TTLCache()
+    generation = cache.generation(1)
+    cache.invalidate(2)
+    cache.set(1, 'value', generation)
+    assert cache.get(1) == 'value'
+
+
+def test_generations_stay_bounded():
+    cache = TTLCache(maxsize=4)
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    for key in range(2, 10):
+        cache.invalidate(key)
+    # Счётчик ключа 1 удалён вместе с остальными, но чтение всё равно отменено
+    cache.set(1, 'stale', generation)
+    assert cache.get(1) is None
+    assert len(cache._generations) <= 4
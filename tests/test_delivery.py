@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from delivery import DeliveryPool
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((time.monotonic(), chat_id, text))
+
+
+def test_busy_chat_does_not_delay_other_chats():
+    bot = RecordingBot()
+
+    async def run():
+        pool = DeliveryPool(workers=4, global_rate=1000, per_chat_rate=20)
+        pool.start(bot)
+        started = time.monotonic()
+        for number in range(20):
+            await pool.send_message('busy', text=str(number))
+        for chat_id in range(30):
+            await pool.send_message(chat_id, text='hello')
+        await pool.stop()
+        return started
+
+    started = asyncio.run(run())
+
+    others = [sent_at - started for sent_at, chat_id, _ in bot.sent if chat_id != 'busy']
+    busy = [(sent_at - started, text) for sent_at, chat_id, text in bot.sent if chat_id == 'busy']
+    assert len(others) == 30
+    # Остальные чаты не ждут, пока выйдет очередь занятого чата (около секунды)
+    assert max(others) < 0.3
+    # Занятый чат получает сообщения по порядку и не чаще своего лимита
+    assert [text for _, text in busy] == [str(number) for number in range(20)]
+    assert busy[-1][0] >= 19 / 20 * 0.9
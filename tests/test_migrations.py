@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, select, text
+
+from database.migrations import upgrade
+from database.models import Cases
+
+# Схема базы до всех миграций (исходные модели Users, Cases и File)
+BASELINE_SCHEMA = (
+    '''CREATE TABLE users (
+        id VARCHAR(100) NOT NULL PRIMARY KEY,
+        username VARCHAR(100),
+        first_name VARCHAR(100),
+        last_name VARCHAR(100)
+    )''',
+    '''CREATE TABLE cases (
+        id INTEGER NOT NULL PRIMARY KEY,
+        user_id VARCHAR(100) REFERENCES users (id),
+        name VARCHAR(100),
+        start_date DATETIME NOT NULL,
+        description VARCHAR(100),
+        deadline_date DATETIME,
+        repeat VARCHAR(100),
+        is_finished BOOLEAN,
+        last_notification DATETIME,
+        original_deadline DATETIME
+    )''',
+    '''CREATE TABLE file (
+        id INTEGER NOT NULL PRIMARY KEY,
+        case_id INTEGER REFERENCES cases (id),
+        file_name VARCHAR(100),
+        file_url VARCHAR(100)
+    )''',
+)
+
+
+def create_baseline_database(path):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO users (id) VALUES ('1')"))
+        connection.execute(text(
+            'INSERT INTO cases (id, user_id, name, start_date, deadline_date, repeat, '
+            'is_finished, original_deadline) VALUES '
+            "(1, '1', 'daily', '2030-01-01 08:00:00', '2030-01-01 09:00:00', 'Ежедневно', 0, "
+            "'2030-01-01 09:00:00')",
+        ))
+    return engine
+
+
+def test_upgrade_from_baseline_schema(tmp_path):
+    engine = create_baseline_database(tmp_path / 'database.db')
+
+    upgrade(engine)
+    # Повторный запуск ничего не меняет
+    upgrade(engine)
+
+    columns = {column['name'] for column in inspect(engine).get_columns('cases')}
+    assert {'next_fire_at', 'rrule', 'partition'} <= columns
+    assert 'tz' in {column['name'] for column in inspect(engine).get_columns('users')}
+    with engine.connect() as connection:
+        case = connection.execute(
+            select(Cases.deadline_date, Cases.rrule, Cases.next_fire_at, Cases.partition)
+            .where(Cases.id == 1),
+        ).one()
+    # Время контейнера (Europe/Moscow, UTC+3) переведено в UTC один раз
+    assert case.deadline_date == datetime(2030, 1, 1, 6, 0)
+    assert case.rrule == 'FREQ=DAILY'
+    assert case.next_fire_at == datetime(2030, 1, 1, 6, 0)
+    assert case.partition is not None
@@ -0,0 +1,27 @@
+import asyncio
+
+from sqlalchemy import select
+
+from database.models import Cases, Users
+from handlers.new_case import create_case
+
+
+def test_dialog_saved_before_rrule_creates_repeating_case(database):
+    database.create_object(Users(id='1'))
+    # Данные диалога из версии бота без правил повторения: только repeat
+    state_data = {
+        'name': 'case',
+        'description': '',
+        'selected_date': '2030-01-01 06:00',
+        'repeat': 'Ежедневно',
+        'attachments': [],
+    }
+
+    case_id = asyncio.run(create_case('1', state_data))
+
+    rule, next_fire_at = database.sql_query(
+        select(Cases.rrule, Cases.next_fire_at).where(Cases.id == case_id),
+        is_single=False,
+    )[0]
+    assert rule == 'FREQ=DAILY'
+    assert next_fire_at is not None
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import and_, or_, select
+
+from database.models import Cases
+from database.query_plans import (
+    explain,
+    find_unconstrained_columns,
+    find_unindexed_queries,
+    get_hot_queries,
+    is_full_scan,
+)
+from utils.timezones import utcnow
+
+HOT_QUERIES = sorted(get_hot_queries())
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_searches_range_by_index(database, name):
+    query, columns = get_hot_queries()[name]
+    with database.engine.connect() as connection:
+        plan = explain(connection, query)
+
+    assert not any(is_full_scan(step) for step in plan), plan
+    assert find_unconstrained_columns(plan, columns) == [], plan
+
+
+def test_prefix_only_search_is_reported(database):
+    # Прежний запрос дел на сегодня: без ANALYZE SQLite ищет по префиксу
+    # (user_id, is_finished) и читает все активные дела пользователя
+    now = utcnow()
+    tomorrow = now + timedelta(days=1)
+    query = select(Cases).where(
+        Cases.user_id == '0',
+        Cases.is_finished == False,  # noqa: E712
+        or_(
+            and_(Cases.deadline_date >= now, Cases.deadline_date < tomorrow),
+            and_(Cases.original_deadline >= now, Cases.original_deadline < tomorrow),
+            and_(Cases.next_fire_at >= now, Cases.next_fire_at < tomorrow),
+        ),
+    ).order_by(Cases.deadline_date)
+    with database.engine.connect() as connection:
+        plan = explain(connection, query)
+
+    assert find_unconstrained_columns(
+        plan,
+        ('deadline_date', 'original_deadline', 'next_fire_at'),
+    ), plan
+
+
+def test_no_unindexed_hot_queries(database):
+    assert find_unindexed_queries(database.engine) == {}
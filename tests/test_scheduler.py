@@ -0,0 +1,77 @@
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import select
+
+import scheduler
+from database.models import Cases, ReminderOutbox, Users
+from scheduler import ReminderQueue, check_and_send_reminders
+from utils.timezones import utcnow
+
+PARTITION = 7
+
+
+def create_case(database, fire_at):
+    database.create_object(Users(id='1'))
+    return database.create_object(Cases(
+        user_id='1',
+        name='case',
+        start_date=fire_at,
+        deadline_date=fire_at,
+        original_deadline=fire_at,
+        is_finished=False,
+        next_fire_at=fire_at,
+        partition=PARTITION,
+    ))
+
+
+def test_refill_loads_case_written_by_another_process_between_ticks(database, monkeypatch):
+    queue = ReminderQueue()
+    monkeypatch.setattr(scheduler, 'reminder_queue', queue)
+    queue.set_partitions({PARTITION})
+    now = utcnow()
+
+    async def run():
+        await queue.refill(now + queue.lookahead)
+        # Дело создаёт процесс без колеса, а таймер успевает пройти его срабатывание
+        case_id = create_case(database, now + timedelta(seconds=5))
+        queue.pop_due(now + timedelta(seconds=40))
+        await queue.refill(now + timedelta(seconds=40) + queue.lookahead)
+        await check_and_send_reminders(now + timedelta(seconds=41))
+        return case_id
+
+    case_id = asyncio.run(run())
+
+    assert database.sql_query(select(Cases.is_finished).where(Cases.id == case_id))
+    assert database.sql_query(
+        select(ReminderOutbox.case_id).where(ReminderOutbox.case_id == case_id),
+    ) == case_id
+
+
+def test_reschedule_ignores_cases_of_other_partitions():
+    queue = ReminderQueue()
+    fire_at = utcnow() + timedelta(minutes=1)
+
+    queue.reschedule(1, fire_at, PARTITION)
+    assert len(queue) == 0
+
+    queue.set_partitions({PARTITION})
+    queue.reschedule(1, fire_at, PARTITION)
+    queue.reschedule(2, fire_at, PARTITION + 1)
+    assert len(queue) == 1
+
+
+def test_late_one_off_case_is_sent_as_missed(database, monkeypatch):
+    queue = ReminderQueue()
+    monkeypatch.setattr(scheduler, 'reminder_queue', queue)
+    queue.set_partitions({PARTITION})
+    fire_at = (utcnow() - timedelta(minutes=5)).replace(microsecond=0)
+    case_id = create_case(database, fire_at)
+    queue.reschedule(case_id, fire_at, PARTITION)
+
+    asyncio.run(check_and_send_reminders())
+
+    assert database.sql_query(select(Cases.is_finished).where(Cases.id == case_id))
+    assert database.sql_query(
+        select(ReminderOutbox.missed).where(ReminderOutbox.case_id == case_id),
+    )
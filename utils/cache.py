@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_HITS, CACHE_MISSES, CACHE_SIZE
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с ограничением времени жизни записей и счётчиками попаданий.
+
+    Попадания, промахи и размер кэша с именем name экспортируются в
+    Prometheus с меткой cache (см. metrics.py).
+
+    Чтение из базы с последующим set может пересечься с изменением записи:
+    значение, прочитанное до invalidate, нельзя класть в кэш после него.
+    Для этого перед чтением берётся generation(key) и передаётся в set -
+    если ключ за это время сбрасывался, значение не кэшируется.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        # Счётчики сбросов ключей; epoch меняется при очистке счётчиков
+        self._generations = {}
+        self._epoch = 0
+        self._hits_metric = None
+        self._misses_metric = None
+        if name is not None:
+            self._hits_metric = CACHE_HITS.labels(name)
+            self._misses_metric = CACHE_MISSES.labels(name)
+            CACHE_SIZE.labels(name).set_function(self.__len__)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        item = self._items.get(key, _MISSING)
+        if item is not _MISSING:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                if self._hits_metric is not None:
+                    self._hits_metric.inc()
+                return value
+            del self._items[key]
+        self.misses += 1
+        if self._misses_metric is not None:
+            self._misses_metric.inc()
+        return default
+
+    def generation(self, key):
+        """Версия key для set: меняется при каждом сбросе ключа."""
+        return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key, value, generation=None):
+        """Кэширует value, если key не сбрасывался с момента generation."""
+        if generation is not None and generation != self.generation(key):
+            return
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        self._items.pop(key, None)
+        if len(self._generations) >= self.maxsize:
+            # Смена epoch отменяет и начатые чтения, чьи счётчики удаляются
+            self._generations.clear()
+            self._epoch += 1
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        self._items.clear()
+        self._generations.clear()
+        self._epoch += 1
+
+    def stats(self):
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,33 @@
+import asyncio
+
+MEDIA_GROUP_WINDOW_SECONDS = 0.5
+
+
+class MediaGroupCollector:
+    """Собирает сообщения одного альбома (media_group_id) в один список.
+
+    Telegram присылает альбом отдельными сообщениями. Первое сообщение
+    альбома ждёт window секунд, пока остальные обработчики добавят свои
+    сообщения, и получает весь альбом целиком; остальные получают None.
+    Обработчики должны выполняться параллельно (handle_as_tasks в aiogram).
+    """
+
+    def __init__(self, window=MEDIA_GROUP_WINDOW_SECONDS):
+        self.window = window
+        self._groups = {}
+
+    async def collect(self, message):
+        if not message.media_group_id:
+            return [message]
+
+        group = self._groups.get(message.media_group_id)
+        if group is not None:
+            group.append(message)
+            return None
+
+        self._groups[message.media_group_id] = [message]
+        await asyncio.sleep(self.window)
+        return self._groups.pop(message.media_group_id)
+
+
+media_groups = MediaGroupCollector()
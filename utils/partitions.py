@@ -0,0 +1,8 @@
+import zlib
+
+PARTITIONS_COUNT = 64
+
+
+def get_partition(user_id) -> int:
+    """Партиция планировщика, к которой относятся дела пользователя."""
+    return zlib.crc32(str(user_id).encode()) % PARTITIONS_COUNT
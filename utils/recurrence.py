@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import rrulestr
+
+# Варианты повторения из клавиатуры get_repeat_keyboard
+REPEAT_DAILY = 'Ежедневно'
+REPEAT_WEEKLY = 'Еженедельно'
+REPEAT_MONTHLY = 'Ежемесячно'
+REPEAT_WEEKDAYS = 'По будням'
+REPEAT_LAST_DAY_OF_MONTH = 'В последний день месяца'
+REPEAT_EVERY_N_DAYS = 'Каждые N дней'
+REPEAT_NONE = 'Без напоминаний'
+
+MAX_INTERVAL_DAYS = 365
+
+# Правила хранятся в Cases.rrule строкой RRULE (RFC 5545) без DTSTART:
+# точкой отсчёта служит дедлайн дела
+RULES = {
+    REPEAT_DAILY: 'FREQ=DAILY',
+    REPEAT_WEEKLY: 'FREQ=WEEKLY',
+    REPEAT_MONTHLY: 'FREQ=MONTHLY',
+    REPEAT_WEEKDAYS: 'FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR',
+    REPEAT_LAST_DAY_OF_MONTH: 'FREQ=MONTHLY;BYMONTHDAY=-1',
+}
+
+
+def rule_for_repeat(repeat):
+    """Правило повторения для варианта из клавиатуры.
+
+    Неизвестные варианты (например, из старых версий бота) повторяются
+    ежедневно, как и раньше.
+    """
+    if not repeat or repeat == REPEAT_NONE:
+        return None
+    return RULES.get(repeat, RULES[REPEAT_DAILY])
+
+
+def every_n_days(interval: int) -> tuple:
+    """Подпись и правило для повторения раз в interval дней."""
+    return f'Каждые {interval} дн.', f'FREQ=DAILY;INTERVAL={interval}'
+
+
+def parse_interval(text):
+    """Число дней из ответа пользователя или None, если оно некорректно."""
+    try:
+        interval = int(text.strip())
+    except (AttributeError, ValueError):
+        return None
+    if 1 <= interval <= MAX_INTERVAL_DAYS:
+        return interval
+    return None
+
+
+def parse_rule(rule: str) -> dict:
+    return dict(part.split('=', 1) for part in rule.split(';'))
+
+
+def _anchor(parts: dict, dtstart: datetime, after: datetime) -> datetime:
+    """Сдвигает точку отсчёта правила вперёд на целое число периодов.
+
+    rrule перебирает срабатывания от DTSTART, поэтому без сдвига поиск
+    следующего срабатывания давнего дела стоит O(числа прошедших периодов).
+    Сдвиг на кратное INTERVAL число периодов сохраняет фазу правила.
+    """
+    interval = int(parts.get('INTERVAL', 1))
+    freq = parts['FREQ']
+    if freq in ('DAILY', 'WEEKLY'):
+        period = timedelta(days=interval * (7 if freq == 'WEEKLY' else 1))
+        periods = (after - dtstart) // period - 1
+        return dtstart + period * max(periods, 0)
+    if freq == 'MONTHLY':
+        months = (after.year - dtstart.year) * 12 + after.month - dtstart.month - 1
+        return dtstart + relativedelta(months=max(months, 0) // interval * interval)
+    return dtstart
+
+
+def next_occurrence(rule: str, dtstart: datetime, after: datetime):
+    """Ближайшее срабатывание правила rule с началом dtstart не раньше after."""
+    dtstart = dtstart.replace(second=0, microsecond=0)
+    parts = parse_rule(rule)
+    # Неявные день недели и число месяца берутся из DTSTART, поэтому
+    # перед сдвигом точки отсчёта они фиксируются в правиле явно
+    if parts['FREQ'] == 'WEEKLY' and 'BYDAY' not in parts:
+        rule += ';BYDAY=' + ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')[dtstart.weekday()]
+    if parts['FREQ'] == 'MONTHLY' and 'BYDAY' not in parts and 'BYMONTHDAY' not in parts:
+        rule += f';BYMONTHDAY={dtstart.day}'
+    start = _anchor(parts, dtstart, after)
+    return rrulestr(rule, dtstart=start).after(after, inc=True)
@@ -0,0 +1,32 @@
+from datetime import datetime, time, timedelta
+
+from utils.recurrence import next_occurrence
+from utils.timezones import to_local, to_utc
+
+
+def compute_next_fire_at(deadline: datetime, rule: str, after: datetime, tz=None):
+    """Вычисляет ближайшее время срабатывания напоминания не раньше after.
+
+    Для неповторяющихся дел это сам дедлайн, для повторяющихся — ближайшее
+    срабатывание правила повторения (см. utils/recurrence.py). Время
+    передаётся и возвращается в UTC, а правило применяется в часовом поясе
+    пользователя tz, чтобы повтор "в 9:00" не сдвигался при переходе на
+    летнее время.
+    """
+    if deadline is None:
+        return None
+    if not rule:
+        return deadline
+    local_next = next_occurrence(rule, to_local(deadline, tz), to_local(after, tz))
+    if local_next is None:
+        return None
+    return to_utc(local_next, tz)
+
+
+def get_day_bounds(day, tz=None) -> tuple:
+    """Возвращает полуинтервал [начало дня, начало следующего дня) в UTC.
+
+    day - дата в часовом поясе пользователя tz.
+    """
+    day_start = datetime.combine(day, time.min)
+    return to_utc(day_start, tz), to_utc(day_start + timedelta(days=1), tz)
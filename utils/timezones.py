@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Часовой пояс пользователей по умолчанию - в нём бот работал до хранения
+# времени в UTC (TZ контейнера в docker-compose.yaml)
+DEFAULT_TZ = 'Europe/Moscow'
+
+DISPLAY_FORMAT = '%Y-%m-%d %H:%M'
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+
+
+def utcnow() -> datetime:
+    """Текущее время UTC без tzinfo - в таком виде время хранится в базе."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@lru_cache(maxsize=None)
+def _load_zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def get_zone(tz) -> ZoneInfo:
+    """Часовой пояс по имени IANA (неизвестные имена заменяются DEFAULT_TZ)."""
+    try:
+        return _load_zone(tz or DEFAULT_TZ)
+    except (ZoneInfoNotFoundError, ValueError):
+        return _load_zone(DEFAULT_TZ)
+
+
+def is_valid_tz(name: str) -> bool:
+    try:
+        _load_zone(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+def to_utc(local: datetime, tz) -> datetime:
+    """Местное время пользователя (без tzinfo) в UTC (без tzinfo)."""
+    if local is None:
+        return None
+    aware = local.replace(tzinfo=get_zone(tz))
+    return aware.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_local(utc: datetime, tz) -> datetime:
+    """Время UTC из базы в местное время пользователя (без tzinfo)."""
+    if utc is None:
+        return None
+    aware = utc.replace(tzinfo=timezone.utc)
+    return aware.astimezone(get_zone(tz)).replace(tzinfo=None)
+
+
+def format_local(utc: datetime, tz, date_format=DISPLAY_FORMAT) -> str:
+    """Время из базы в виде строки в часовом поясе пользователя."""
+    if utc is None:
+        return '-'
+    return to_local(utc, tz).strftime(date_format)
+
+
+def to_epoch_second(utc: datetime) -> int:
+    """Время UTC без tzinfo в секундах Unix, с округлением вверх до целой секунды."""
+    return -((EPOCH - utc) // SECOND)
+
+
+def from_epoch_second(second: int) -> datetime:
+    """Секунды Unix во время UTC без tzinfo."""
+    return EPOCH + second * SECOND
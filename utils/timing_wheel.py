@@ -0,0 +1,120 @@
+"""Иерархическое колесо таймеров с точностью до секунды.
+
+Время - целые секунды (например, Unix-время). Колесо состоит из уровней по
+60 секунд, 60 минут и 24 часа, более дальние срабатывания хранятся по
+суткам. Срабатывание лежит на уровне самой крупной единицы, в которой оно
+совпадает с текущим временем колеса: в текущей минуте - в секундном слоте,
+в текущем часе - в минутном и т.д. При переходе колеса на новую минуту
+(час, сутки) её слот раскладывается по младшим уровням, так что каждое
+срабатывание перекладывается не больше трёх раз.
+
+Слот - множество ключей, а секунда срабатывания ключа хранится в словаре,
+поэтому положение ключа вычисляется по его секунде, и добавление, перенос
+и отмена выполняются за O(1). На ключ приходится одно срабатывание: на
+запись нужны только словарь и множество, без отдельных объектов.
+"""
+SECONDS_PER_MINUTE = 60
+SECONDS_PER_HOUR = 60 * SECONDS_PER_MINUTE
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+
+
+class TimingWheel:
+    """Срабатывания ключей по секундам; now - последняя пройденная секунда."""
+
+    def __init__(self, now):
+        self.now = now
+        self._seconds = {}
+        self._expired = set()
+        self._second_slots = [set() for _ in range(SECONDS_PER_MINUTE)]
+        self._minute_slots = [set() for _ in range(SECONDS_PER_HOUR // SECONDS_PER_MINUTE)]
+        self._hour_slots = [set() for _ in range(SECONDS_PER_DAY // SECONDS_PER_HOUR)]
+        self._days = {}
+
+    def __len__(self):
+        return len(self._seconds)
+
+    def __contains__(self, key):
+        return key in self._seconds
+
+    def get(self, key):
+        """Секунда срабатывания key или None."""
+        return self._seconds.get(key)
+
+    def schedule(self, key, second):
+        """Добавляет срабатывание key или переносит его на секунду second.
+
+        Прошедшая секунда допустима: такое срабатывание вернёт ближайший advance.
+        """
+        previous = self._seconds.get(key)
+        if previous == second:
+            return
+        if previous is not None:
+            self._discard(key, previous)
+        self._seconds[key] = second
+        self._slot(second).add(key)
+
+    def cancel(self, key):
+        """Отменяет срабатывание key; возвращает False, если его не было."""
+        second = self._seconds.pop(key, None)
+        if second is None:
+            return False
+        self._discard(key, second)
+        return True
+
+    def clear(self, now):
+        """Удаляет все срабатывания и переводит колесо на секунду now."""
+        self.__init__(now)
+
+    def advance(self, now):
+        """Переводит колесо на секунду now и возвращает наступившие срабатывания.
+
+        Результат - словарь {ключ: секунда}; время назад колесо не идёт.
+        """
+        if now - self.now > SECONDS_PER_DAY:
+            # Долгий простой: проще заново разложить все срабатывания
+            seconds = self._seconds
+            self.clear(now)
+            self._seconds = seconds
+            for key, second in seconds.items():
+                self._slot(second).add(key)
+        while self.now < now:
+            self.now += 1
+            second = self.now
+            if second % SECONDS_PER_MINUTE == 0:
+                if second % SECONDS_PER_HOUR == 0:
+                    if second % SECONDS_PER_DAY == 0:
+                        self._cascade(self._days.pop(second // SECONDS_PER_DAY, ()))
+                    self._cascade(self._hour_slots[second // SECONDS_PER_HOUR % 24])
+                self._cascade(self._minute_slots[second // SECONDS_PER_MINUTE % 60])
+            slot = self._second_slots[second % SECONDS_PER_MINUTE]
+            if slot:
+                self._expired |= slot
+                slot.clear()
+
+        expired, self._expired = self._expired, set()
+        return {key: self._seconds.pop(key) for key in expired}
+
+    def _slot(self, second):
+        now = self.now
+        if second <= now:
+            return self._expired
+        if second // SECONDS_PER_MINUTE == now // SECONDS_PER_MINUTE:
+            return self._second_slots[second % SECONDS_PER_MINUTE]
+        if second // SECONDS_PER_HOUR == now // SECONDS_PER_HOUR:
+            return self._minute_slots[second // SECONDS_PER_MINUTE % 60]
+        if second // SECONDS_PER_DAY == now // SECONDS_PER_DAY:
+            return self._hour_slots[second // SECONDS_PER_HOUR % 24]
+        return self._days.setdefault(second // SECONDS_PER_DAY, set())
+
+    def _discard(self, key, second):
+        slot = self._slot(second)
+        slot.discard(key)
+        day = second // SECONDS_PER_DAY
+        if not slot and self._days.get(day) is slot:
+            del self._days[day]
+
+    def _cascade(self, slot):
+        for key in slot:
+            self._slot(self._seconds[key]).add(key)
+        if slot:
+            slot.clear()
@@ -0,0 +1,22 @@
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+WEBHOOK_PATH = '/webhook'
+
+
+def create_webhook_app(dispatcher, bot, secret_token=None, path=WEBHOOK_PATH):
+    """aiohttp-приложение, принимающее обновления Telegram через webhook.
+
+    Каждый POST обрабатывается отдельной задачей, поэтому обновления от
+    разных пользователей обрабатываются параллельно. Если задан
+    secret_token, запросы без заголовка
+    X-Telegram-Bot-Api-Secret-Token с этим значением отклоняются.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=secret_token,
+    ).register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    return app